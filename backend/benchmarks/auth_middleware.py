@@ -0,0 +1,63 @@
+"""
+Cold vs warm cost of the main server's token authentication.
+
+Cold runs verify the RS256 signature on every call, warm runs are answered by the verified-token cache.
+
+Usage (from the backend directory):
+    python benchmarks/auth_middleware.py [iterations]
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'services' / 'main_server'))
+
+from auth import Authenticator, JwksKeyStore, VerifiedTokenCache  # noqa: E402
+
+AUDIENCE = 'https://main_server_api'
+ISSUER = 'https://benchmark.example.com/'
+
+
+class StaticKeyStore(JwksKeyStore):
+    def __init__(self, kid: str, public_key):
+        super().__init__('http://unused')
+        self._keys = {kid: public_key}
+        self._fetched_at = time.monotonic()
+
+
+async def run(iterations: int):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = jwt.encode(
+        {'sub': 'auth0|benchmark', 'aud': AUDIENCE, 'iss': ISSUER, 'exp': int(time.time()) + 3600},
+        private_key,
+        algorithm='RS256',
+        headers={'kid': 'benchmark'},
+    )
+    key_store = StaticKeyStore('benchmark', private_key.public_key())
+
+    cold = Authenticator(key_store, VerifiedTokenCache(max_entries=0), AUDIENCE, ISSUER)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await cold.authenticate(token)
+    cold_seconds = time.perf_counter() - start
+
+    warm = Authenticator(key_store, VerifiedTokenCache(), AUDIENCE, ISSUER)
+    await warm.authenticate(token)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await warm.authenticate(token)
+    warm_seconds = time.perf_counter() - start
+
+    print(f'iterations: {iterations}')
+    print(f'cold (signature verified every call): {cold_seconds / iterations * 1e6:8.1f} us/request')
+    print(f'warm (verified-token cache hit):      {warm_seconds / iterations * 1e6:8.1f} us/request')
+    print(f'speedup: {cold_seconds / warm_seconds:.1f}x')
+
+
+if __name__ == '__main__':
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
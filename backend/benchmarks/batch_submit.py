@@ -0,0 +1,49 @@
+"""
+Time to submit a batch of summaries through POST /api/batch.
+
+Usage (from the backend directory, against a running main server):
+    python benchmarks/batch_submit.py --base-url http://localhost:8000/api --token <bearer token> --size 1000
+
+The default size is the largest batch the defaults allow, BATCH_MAX_SIZE and
+ADMISSION_MAX_BATCH_OUTSTANDING_PER_USER are both 1000. The user must not have other jobs still in the workers,
+or the batch goes over the allowance and is turned away with 429.
+"""
+
+import argparse
+import time
+
+import isbnlib
+import requests
+
+
+def make_isbns(count: int, offset: int) -> list[str]:
+    # valid, distinct ISBN-13s so every item takes the full insert and publish path
+    isbns = []
+    for n in range(count):
+        isbn10 = f'{(offset + n) % 1_000_000_000:09d}'
+        isbns.append(isbnlib.to_isbn13(isbn10 + isbnlib.check_digit10(isbn10)))
+    return isbns
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base-url', default='http://localhost:8000/api')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--size', type=int, default=1000)
+    parser.add_argument('--model', default='mistral_latest__300')
+    parser.add_argument('--language', default='en')
+    args = parser.parse_args()
+
+    isbns = make_isbns(args.size, int(time.time()))
+    payload = [{'isbn': isbn, 'language': args.language, 'model': args.model} for isbn in isbns]
+    start = time.perf_counter()
+    response = requests.post(
+        f'{args.base_url}/batch', json=payload, headers={'Authorization': f'Bearer {args.token}'}
+    )
+    elapsed = time.perf_counter() - start
+    response.raise_for_status()
+    print(f'{len(response.json()["ids"])} summaries submitted in {elapsed * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""
+Fires concurrent GET /api/all requests against a running main server and reports how much they overlap.
+
+If the handlers block the event loop the requests are answered one after another and the wall time is close
+to the sum of the individual latencies (overlap ~1x). With non-blocking database access the overlap grows
+towards the concurrency level.
+
+Usage (from the backend directory):
+    python benchmarks/concurrent_all.py --url http://localhost:8000/api/all --token <bearer token> --concurrency 20
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def timed_get(session: requests.Session, url: str, headers: dict) -> float:
+    start = time.perf_counter()
+    response = session.get(url, headers=headers)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default='http://localhost:8000/api/all')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    headers = {'Authorization': f'Bearer {args.token}'}
+    sessions = [requests.Session() for _ in range(args.concurrency)]
+    # warm up connections and server side caches
+    for session in sessions:
+        timed_get(session, args.url, headers)
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        for round_number in range(1, args.rounds + 1):
+            start = time.perf_counter()
+            latencies = list(executor.map(lambda session: timed_get(session, args.url, headers), sessions))
+            wall = time.perf_counter() - start
+            print(
+                f'round {round_number}: wall {wall * 1000:8.1f} ms | '
+                f'sum of latencies {sum(latencies) * 1000:8.1f} ms | '
+                f'median {statistics.median(latencies) * 1000:7.1f} ms | '
+                f'overlap {sum(latencies) / wall:5.1f}x (concurrency {args.concurrency})'
+            )
+
+
+if __name__ == '__main__':
+    main()
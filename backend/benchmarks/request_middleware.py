@@ -0,0 +1,152 @@
+"""
+Per-request overhead of the authentication and context middleware, before and after the switch to pure ASGI.
+
+"before" rebuilds the two @app.middleware('http') layers the main server used to stack, "after" is the
+AuthContextMiddleware it uses now. Both wrap the same trivial endpoint and are called in-process through the ASGI
+interface with a warm verified-token cache, so the difference is the middleware machinery itself.
+
+Usage (from the backend directory):
+    python benchmarks/request_middleware.py [iterations]
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'services' / 'main_server'))
+
+from auth import Authenticator, VerifiedTokenCache  # noqa: E402
+from auth_middleware import AUDIENCE, ISSUER, StaticKeyStore  # noqa: E402
+from request_context import AuthContextMiddleware  # noqa: E402
+
+from errors.http import UnAuthenticatedError  # noqa: E402
+
+
+class BenchmarkConfig:
+    def __init__(self, auth: Authenticator):
+        self.auth = auth
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get('/api/health')
+    async def health():
+        return {'status': 'healthy'}
+
+    @app.get('/api/me')
+    async def me(request: Request):
+        return JSONResponse({'user': request.state.user_id})
+
+    return app
+
+
+def before_app(config: BenchmarkConfig) -> FastAPI:
+    app = make_app()
+
+    @app.middleware('http')
+    async def authenticate_user(request: Request, call_next):
+        if request.method == 'OPTIONS' or request.url.path == '/api/health':
+            return await call_next(request)
+        auth_header = request.headers.get('Authorization')
+        if auth_header:
+            token = auth_header.split('Bearer ')[1]
+            try:
+                decoded_token = await config.auth.authenticate(token)
+                if decoded_token is None:
+                    return UnAuthenticatedError()
+                request.state.user_id = decoded_token['sub']
+                return await call_next(request)
+            except jwt.PyJWTError:
+                pass
+            return UnAuthenticatedError()
+        return UnAuthenticatedError()
+
+    @app.middleware('http')
+    async def config_middleware(request: Request, call_next):
+        request.state.config = config
+        return await call_next(request)
+
+    return app
+
+
+def after_app(config: BenchmarkConfig) -> FastAPI:
+    app = make_app()
+    app.add_middleware(AuthContextMiddleware, config=config)
+    return app
+
+
+async def call(app, path: str, headers: list[tuple[bytes, bytes]]) -> int:
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': b'',
+        'headers': headers,
+        'client': ('127.0.0.1', 50000),
+        'server': ('127.0.0.1', 8000),
+    }
+    status = 0
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await app(scope, receive, send)
+    return status
+
+
+async def measure(app, path: str, headers: list[tuple[bytes, bytes]], iterations: int) -> float:
+    # the first call builds the middleware stack
+    assert await call(app, path, headers) == 200
+    start = time.perf_counter()
+    for _ in range(iterations):
+        await call(app, path, headers)
+    return (time.perf_counter() - start) / iterations
+
+
+async def run(iterations: int):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    token = jwt.encode(
+        {'sub': 'auth0|benchmark', 'aud': AUDIENCE, 'iss': ISSUER, 'exp': int(time.time()) + 3600},
+        private_key,
+        algorithm='RS256',
+        headers={'kid': 'benchmark'},
+    )
+    config = BenchmarkConfig(
+        Authenticator(StaticKeyStore('benchmark', private_key.public_key()), VerifiedTokenCache(), AUDIENCE, ISSUER)
+    )
+    headers = [(b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode())]
+
+    bare_health = await measure(make_app(), '/api/health', [], iterations)
+
+    print(f'iterations: {iterations}')
+    print(f'{"":<28}{"before":>12}{"after":>12}')
+    for label, path, request_headers in (
+        ('authenticated GET /api/me', '/api/me', headers),
+        ('GET /api/health', '/api/health', []),
+    ):
+        before = await measure(before_app(config), path, request_headers, iterations)
+        after = await measure(after_app(config), path, request_headers, iterations)
+        print(f'{label:<28}{before * 1e6:9.1f} us{after * 1e6:9.1f} us   ({before / after:.1f}x)')
+    print(f'{"no middleware /api/health":<28}{bare_health * 1e6:9.1f} us')
+
+
+if __name__ == '__main__':
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000))
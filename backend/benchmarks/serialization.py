@@ -0,0 +1,90 @@
+"""
+Serialization CPU and bytes on the wire for a completed /status payload and a 50 item /all payload.
+
+Compares the old path (validated Summary, model_dump, jsonable_encoder, json.dumps) with the orjson path used by
+FastJSONResponse, and the body size uncompressed, gzipped and brotli compressed.
+
+Usage (from the backend directory):
+    python benchmarks/serialization.py [iterations]
+"""
+
+import gzip
+import json
+import random
+import string
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import brotli
+from fastapi.encoders import jsonable_encoder
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'services' / 'main_server'))
+
+from serialization import dumps  # noqa: E402
+
+from models.postgres_metadata import Summary  # noqa: E402
+
+
+def prose(words: int) -> str:
+    rng = random.Random(words)
+    vocabulary = [''.join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 9))) for _ in range(800)]
+    return ' '.join(rng.choice(vocabulary) for _ in range(words))
+
+
+ROW = (42, 'auth0|benchmark', '9780141439518', 'completed', datetime(2025, 7, 27, 10, 18, 44), 'en',
+       'mistral_latest__1000', '9780141439518', None)  # fmt: skip
+DOCUMENT = {
+    'language': 'en',
+    'model': 'mistral_latest__1000',
+    'title': 'Pride and Prejudice',
+    'authors': ['Jane Austen'],
+    'sources': [
+        {'type': source, 'url': f'https://{source}.example.com/book', 'data': prose(1500), 'reliability': 80}
+        for source in ('isnbd', 'openlibrary', 'goodreads')
+    ],
+    'content_coverage': 75,
+    'cross_reference': 41,
+    'source_reliability': 80,
+    'generated_summary': prose(400),
+    'medium_confidence': 65,
+}
+
+
+def old_path(rows: list[tuple]) -> bytes:
+    return json.dumps(jsonable_encoder([{**Summary(*row).model_dump(), **DOCUMENT} for row in rows])).encode()
+
+
+def new_path(rows: list[tuple]) -> bytes:
+    return dumps([{**Summary.from_row(row).model_dump(), **DOCUMENT} for row in rows])
+
+
+def timed(fn, rows, iterations: int) -> tuple[bytes, float]:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        body = fn(rows)
+    return body, (time.perf_counter() - start) / iterations
+
+
+def main(iterations: int):
+    for name, rows in (('/status (1 summary)', [ROW]), ('/all (50 summaries)', [ROW] * 50)):
+        old_body, old_seconds = timed(old_path, rows, iterations)
+        new_body, new_seconds = timed(new_path, rows, iterations)
+        print(name)
+        print(f'  serialize  old {old_seconds * 1000:8.3f} ms | orjson {new_seconds * 1000:8.3f} ms')
+        print(
+            f'  bytes      raw {len(new_body):9d} | gzip {len(gzip.compress(new_body, 6)):9d} | '
+            f'br {len(brotli.compress(new_body, quality=4)):9d}'
+        )
+        compressors = (('gzip', lambda body: gzip.compress(body, 6)), ('br', lambda body: brotli.compress(body, quality=4)))
+        for label, compress in compressors:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                compress(new_body)
+            print(f'  {label:4} cpu  {(time.perf_counter() - start) / iterations * 1000:8.3f} ms')
+        assert json.loads(old_body) == json.loads(new_body)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
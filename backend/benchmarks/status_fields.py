@@ -0,0 +1,54 @@
+"""
+Response size and latency of the common polling request, GET /api/status/{id}, with and without `fields=`.
+
+Usage (from the backend directory, against a running main server and a completed summary):
+    python benchmarks/status_fields.py --base-url http://localhost:8000/api --token <bearer token> --id 42
+"""
+
+import argparse
+import statistics
+import time
+
+import requests
+
+
+def measure(session: requests.Session, url: str, headers: dict, iterations: int) -> tuple[int, list[float]]:
+    size = 0
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = session.get(url, headers=headers)
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+        size = len(response.content)
+    return size, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base-url', default='http://localhost:8000/api')
+    parser.add_argument('--token', required=True)
+    parser.add_argument('--id', type=int, required=True)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    headers = {'Authorization': f'Bearer {args.token}'}
+    session = requests.Session()
+    variants = {
+        'full document': f'{args.base_url}/status/{args.id}',
+        'fields=status': f'{args.base_url}/status/{args.id}?fields=status',
+        'fields=status,title,medium_confidence': f'{args.base_url}/status/{args.id}?fields=status,title,medium_confidence',
+    }
+    for name, url in variants.items():
+        measure(session, url, headers, 5)
+        size, latencies = measure(session, url, headers, args.iterations)
+        latencies.sort()
+        print(
+            f'{name:40} {size:9d} bytes | '
+            f'median {statistics.median(latencies) * 1000:7.2f} ms | '
+            f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:7.2f} ms'
+        )
+
+
+if __name__ == '__main__':
+    main()
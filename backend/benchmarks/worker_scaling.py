@@ -0,0 +1,131 @@
+"""
+Requests/sec of the main server as the number of uvicorn workers grows.
+
+For every worker count the server is started with services/main_server/run.py, warmed up, loaded by several client
+processes for a fixed duration and stopped again. The same .env as for a normal run is used, so the databases and
+the broker have to be reachable. /api/health needs no token and shows the raw serving overhead, pass --path and
+--token to measure a real endpoint such as /api/history.
+
+Usage (from the backend directory):
+    python benchmarks/worker_scaling.py --workers 1 2 4 --path /api/history --token <bearer token>
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+import requests
+
+
+def wait_until_up(base_url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(f'{base_url}/api/health', timeout=1).ok:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'server at {base_url} did not come up within {timeout}s')
+
+
+def client(url: str, headers: dict, threads: int, duration: float, results: multiprocessing.Queue):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def loop():
+        nonlocal errors
+        session = requests.Session()
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = session.get(url, headers=headers).ok
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                if ok:
+                    latencies.append(elapsed)
+                else:
+                    errors += 1
+
+    workers = [threading.Thread(target=loop) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    results.put((latencies, errors))
+
+
+def run_load(url: str, headers: dict, processes: int, threads: int, duration: float) -> tuple[list[float], int]:
+    # several client processes, a single Python client runs out of CPU long before a few server workers do
+    results = multiprocessing.Queue()
+    clients = [
+        multiprocessing.Process(target=client, args=(url, headers, threads, duration, results))
+        for _ in range(processes)
+    ]
+    for process in clients:
+        process.start()
+    latencies, errors = [], 0
+    for _ in clients:
+        client_latencies, client_errors = results.get()
+        latencies.extend(client_latencies)
+        errors += client_errors
+    for process in clients:
+        process.join()
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--path', default='/api/health')
+    parser.add_argument('--token')
+    parser.add_argument('--client-processes', type=int, default=4)
+    parser.add_argument('--client-threads', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=15)
+    parser.add_argument('--warmup', type=float, default=3)
+    parser.add_argument('--startup-timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    base_url = f'http://127.0.0.1:{args.port}'
+    url = f'{base_url}{args.path}'
+    headers = {'Authorization': f'Bearer {args.token}'} if args.token else {}
+    run_py = os.path.join(os.path.dirname(__file__), '..', 'services', 'main_server', 'run.py')
+
+    print(f'{"workers":>7} | {"req/s":>9} | {"p50 ms":>8} | {"p99 ms":>8} | {"errors":>6} | scaling')
+    baseline = None
+    for workers in args.workers:
+        server = subprocess.Popen(
+            [sys.executable, run_py, '--host', '127.0.0.1', '--port', str(args.port), '--workers', str(workers)]
+        )
+        try:
+            wait_until_up(base_url, args.startup_timeout)
+            run_load(url, headers, args.client_processes, args.client_threads, args.warmup)
+            latencies, errors = run_load(url, headers, args.client_processes, args.client_threads, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+
+        if not latencies:
+            print(f'{workers:>7} | no successful requests ({errors} errors)')
+            continue
+        rps = len(latencies) / args.duration
+        baseline = baseline or rps
+        quantiles = statistics.quantiles(latencies, n=100)
+        print(
+            f'{workers:>7} | {rps:9.1f} | {statistics.median(latencies) * 1000:8.2f} | '
+            f'{quantiles[98] * 1000:8.2f} | {errors:>6} | {rps / baseline:5.2f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -12,3 +12,20 @@ class UnAuthorizedException(Exception):
 class SummaryNotFoundException(Exception):
     def __init__(self):
         super().__init__('Summary not found')
+
+
+class DatabaseBusyException(Exception):
+    def __init__(self):
+        super().__init__('Database connection pool exhausted')
+
+
+class DatabaseTimeoutException(Exception):
+    def __init__(self):
+        super().__init__('Database query timed out')
+
+
+class OutstandingLimitException(Exception):
+    def __init__(self, outstanding: int, excess: int):
+        self.outstanding = outstanding
+        self.excess = excess
+        super().__init__('Too many outstanding summary jobs')
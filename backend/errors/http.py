@@ -19,3 +19,13 @@ class UnAuthorizedError(HTTPException):
 class SummaryNotFoundError(HTTPException):
     def __init__(self):
         super().__init__(404, 'Summary not found')
+
+
+class ServiceUnavailableError(HTTPException):
+    def __init__(self, message='Service temporarily unavailable') -> None:
+        super().__init__(503, message)
+
+
+class TooManyRequestsError(HTTPException):
+    def __init__(self, message: str, retry_after: int) -> None:
+        super().__init__(429, message, headers={'Retry-After': str(retry_after)})
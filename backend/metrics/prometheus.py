@@ -0,0 +1,246 @@
+import functools
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+# sub-millisecond buckets for cache hits and indexed lookups, up to a minute for long polls and slow sources
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# generation runs from seconds to minutes depending on the model and the summary length
+GENERATION_BUCKETS = (1, 2.5, 5, 10, 20, 30, 45, 60, 90, 120, 180, 300, 600)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds',
+    'Main server request latency by route template',
+    ['method', 'route', 'status'],
+    buckets=LATENCY_BUCKETS,
+)
+POSTGRES_QUERY_SECONDS = Histogram(
+    'postgres_query_duration_seconds',
+    'Time spent in a Summary model method, including the commit',
+    ['method'],
+    buckets=LATENCY_BUCKETS,
+)
+MONGO_OPERATION_SECONDS = Histogram(
+    'mongo_operation_duration_seconds',
+    'Time spent in MongoDB operations',
+    ['operation'],
+    buckets=LATENCY_BUCKETS,
+)
+RABBITMQ_PUBLISH_SECONDS = Histogram(
+    'rabbitmq_publish_duration_seconds',
+    'Time to publish to a queue, until the broker confirmed where confirms are used',
+    ['queue'],
+    buckets=LATENCY_BUCKETS,
+)
+# gauges are summed over the live processes, or the highest value taken, when several uvicorn workers share the port
+POSTGRES_POOL_SIZE = Gauge(
+    'postgres_pool_max_connections',
+    'Connections the Postgres pools may open',
+    multiprocess_mode='livesum',
+)
+POSTGRES_POOL_IN_USE = Gauge(
+    'postgres_pool_connections_in_use',
+    'Pooled Postgres connections handed out to requests',
+    multiprocess_mode='livesum',
+)
+POSTGRES_POOL_WAITING = Gauge(
+    'postgres_pool_waiting_requests',
+    'Requests waiting for a pooled Postgres connection',
+    multiprocess_mode='livesum',
+)
+POSTGRES_POOL_ACQUIRE_SECONDS = Histogram(
+    'postgres_pool_acquire_duration_seconds',
+    'Time a request waited for a pooled Postgres connection',
+    buckets=LATENCY_BUCKETS,
+)
+POSTGRES_POOL_ACQUIRE_TIMEOUTS = Counter(
+    'postgres_pool_acquire_timeouts_total',
+    'Requests turned away after waiting the acquire timeout for a pooled Postgres connection',
+)
+MONGO_OPERATION_TIMEOUTS = Counter(
+    'mongo_operation_timeouts_total',
+    'MongoDB operations that ran past the query timeout',
+    ['operation'],
+)
+RABBITMQ_MESSAGES = Counter(
+    'rabbitmq_published_messages_total',
+    'Messages published by outcome: confirmed or failed',
+    ['queue', 'outcome'],
+)
+RABBITMQ_CONFIRMS_IN_FLIGHT = Gauge(
+    'rabbitmq_confirms_in_flight',
+    'Published messages still waiting for the broker confirm',
+    multiprocess_mode='livesum',
+)
+JWKS_KEY_LOOKUPS = Counter(
+    'auth_jwks_key_lookups_total',
+    'Signing key lookups by kid: hit or miss',
+    ['result'],
+)
+JWKS_REFRESHES = Counter(
+    'auth_jwks_refreshes_total',
+    'JWKS fetches from Auth0 by outcome: ok or failed',
+    ['outcome'],
+)
+TOKEN_CACHE_LOOKUPS = Counter(
+    'auth_token_cache_lookups_total',
+    'Verified token cache lookups: hit, miss or expired',
+    ['result'],
+)
+TOKEN_CACHE_EVICTIONS = Counter(
+    'auth_token_cache_evictions_total',
+    'Tokens dropped from the verified token cache to stay within its bounds',
+)
+SUMMARY_CACHE_LOOKUPS = Counter(
+    'summary_cache_lookups_total',
+    'Completed summary cache lookups: hit or miss',
+    ['result'],
+)
+SUMMARY_CACHE_EVICTIONS = Counter(
+    'summary_cache_evictions_total',
+    'Completed summaries dropped from the cache to stay within its size',
+)
+SUMMARY_CACHE_SIZE_BYTES = Gauge(
+    'summary_cache_size_bytes',
+    'Bytes of serialized summaries held by the completed summary caches',
+    multiprocess_mode='livesum',
+)
+RESULT_REUSE_LOOKUPS = Counter(
+    'summary_result_reuse_total',
+    'New summaries by result reuse outcome: hit, miss or forced (regenerate asked for)',
+    ['result'],
+)
+JOB_COALESCING = Counter(
+    'summary_job_coalescing_total',
+    'New summary jobs by role: leader (runs the job) or follower (waits on a leader)',
+    ['role'],
+)
+STATUS_HUB_NOTIFICATIONS = Counter(
+    'status_hub_notifications_total',
+    'Summary status notifications received on the LISTEN connection',
+)
+STATUS_HUB_RECONNECTS = Counter(
+    'status_hub_reconnects_total',
+    'Times the LISTEN connection was lost and opened again',
+)
+ADMISSION_DECISIONS = Counter(
+    'admission_decisions_total',
+    'Summary requests by admission decision: admitted, queue_depth or user_limit',
+    ['decision'],
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'admission_queue_depth',
+    'Ready messages per worker queue as last seen by admission control',
+    ['queue'],
+    multiprocess_mode='max',
+)
+ADMISSION_REFRESH_FAILURES = Counter(
+    'admission_refresh_failures_total',
+    'Queue depth reads from RabbitMQ that failed',
+)
+SCRAPE_SECONDS = Histogram(
+    'scrape_duration_seconds',
+    'Time to collect data from one source',
+    ['source', 'outcome'],
+    buckets=LATENCY_BUCKETS,
+)
+SCRAPE_JOB_WALL_SECONDS = Histogram(
+    'scrape_job_wall_duration_seconds',
+    'Wall time of the source fetch stage of a scraper job',
+    buckets=LATENCY_BUCKETS,
+)
+SCRAPE_JOB_SOURCE_SUM_SECONDS = Histogram(
+    'scrape_job_source_sum_duration_seconds',
+    'Sum of the per-source times of a scraper job, what the stage would take fetching one source after another',
+    buckets=LATENCY_BUCKETS,
+)
+HTTP_CACHE_REQUESTS = Counter(
+    'scraper_http_cache_requests_total',
+    'Scraper requests by cache result: hit, revalidated (304), miss or bypass',
+    ['host', 'result'],
+)
+HTTP_CACHE_BYTES_SAVED = Counter(
+    'scraper_http_cache_bytes_saved_total',
+    'Response body bytes served from the cache instead of the network',
+    ['host'],
+)
+HTTP_CACHE_SIZE_BYTES = Gauge(
+    'scraper_http_cache_size_bytes',
+    'Bytes on disk taken by the scraper response cache',
+)
+SOURCE_CACHE_LOOKUPS = Counter(
+    'scraper_source_cache_lookups_total',
+    'Per-source records looked up in the edition cluster cache: hit or miss',
+    ['source', 'result'],
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    'rate_limit_wait_seconds',
+    'Time a request waited for a token of a rate limiter',
+    ['bucket'],
+    buckets=LATENCY_BUCKETS,
+)
+RATE_LIMIT_ACQUIRES = Counter(
+    'rate_limit_acquires_total',
+    'Tokens handed out by a rate limiter: local (leased earlier), postgres or fallback (Postgres unreachable)',
+    ['bucket', 'path'],
+)
+OLLAMA_GENERATION_SECONDS = Histogram(
+    'ollama_generation_duration_seconds',
+    'Time Ollama takes to generate a summary',
+    ['model', 'outcome'],
+    buckets=GENERATION_BUCKETS,
+)
+STATUS_TRANSITIONS = Counter(
+    'summary_status_transitions_total',
+    'Summary rows moved to a status',
+    ['status'],
+)
+
+
+def observe_query(fn):
+    """Times a Summary model method into POSTGRES_QUERY_SECONDS under the method's name"""
+    histogram = POSTGRES_QUERY_SECONDS.labels(fn.__name__)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start)
+
+    return wrapper
+
+
+def _registry() -> CollectorRegistry:
+    """
+    The default registry, unless PROMETHEUS_MULTIPROC_DIR is set as it has to be for several uvicorn workers. Then
+    the values every process wrote there are merged, so whichever process is scraped answers for all of them.
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def metrics_payload() -> tuple[bytes, str]:
+    return generate_latest(_registry()), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(default_port: int):
+    """Serves /metrics from a daemon thread on the side port, for the workers that have no HTTP server of their own"""
+    port = int(os.getenv('METRICS_PORT', str(default_port)))
+    if port > 0:
+        start_http_server(port, registry=_registry())
@@ -0,0 +1,27 @@
+"""
+add Summary user history index
+
+Revision ID: 3c9d2e7f41ab
+Revises: 718177fa18d2
+Create Date: 2026-10-18 09:12:31.204518
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '3c9d2e7f41ab'
+down_revision: str | None = '718177fa18d2'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.execute("""CREATE INDEX summary_user_history_idx
+                ON summary (ekz_user, creation_date, id)""")
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX summary_user_history_idx')
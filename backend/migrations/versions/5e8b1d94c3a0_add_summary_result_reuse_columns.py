@@ -0,0 +1,38 @@
+"""
+add Summary result reuse columns
+
+Revision ID: 5e8b1d94c3a0
+Revises: 9a4f0c6b2d17
+Create Date: 2026-10-18 13:26:07.118342
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '5e8b1d94c3a0'
+down_revision: str | None = '9a4f0c6b2d17'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.execute("""ALTER TABLE summary
+                ADD COLUMN language TEXT,
+                ADD COLUMN model TEXT,
+                ADD COLUMN isbn13 TEXT,
+                ADD COLUMN result_id INTEGER REFERENCES summary (id)""")
+    op.execute("""CREATE INDEX summary_reusable_result_idx
+                ON summary (isbn13, language, model, creation_date)
+                WHERE status = 'completed' AND result_id IS NULL""")
+
+
+def downgrade() -> None:
+    op.execute('DROP INDEX summary_reusable_result_idx')
+    op.execute("""ALTER TABLE summary
+                DROP COLUMN result_id,
+                DROP COLUMN isbn13,
+                DROP COLUMN model,
+                DROP COLUMN language""")
@@ -0,0 +1,37 @@
+"""
+notify Summary status changes
+
+Revision ID: 9a4f0c6b2d17
+Revises: 3c9d2e7f41ab
+Create Date: 2026-10-18 11:03:52.770931
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4f0c6b2d17'
+down_revision: str | None = '3c9d2e7f41ab'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.execute("""CREATE FUNCTION notify_summary_status() RETURNS trigger AS $$
+                BEGIN
+                    PERFORM pg_notify('summary_status', NEW.id || ':' || NEW.status);
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql""")
+    op.execute("""CREATE TRIGGER summary_status_notify
+                AFTER UPDATE OF status ON summary
+                FOR EACH ROW
+                WHEN (OLD.status IS DISTINCT FROM NEW.status)
+                EXECUTE FUNCTION notify_summary_status()""")
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER summary_status_notify ON summary')
+    op.execute('DROP FUNCTION notify_summary_status()')
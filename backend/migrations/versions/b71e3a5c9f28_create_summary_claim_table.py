@@ -0,0 +1,54 @@
+"""
+create Summary claim table
+
+Revision ID: b71e3a5c9f28
+Revises: 5e8b1d94c3a0
+Create Date: 2026-10-18 14:41:19.532810
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'b71e3a5c9f28'
+down_revision: str | None = '5e8b1d94c3a0'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.execute("""CREATE TABLE summary_claim(
+                claim_key TEXT PRIMARY KEY,
+                leader_id INTEGER NOT NULL REFERENCES summary (id),
+                claimed_at TIMESTAMP DEFAULT NOW() NOT NULL
+                )""")
+    # the propagation below looks up a leader's followers on every status change of every job
+    op.execute("""CREATE INDEX summary_result_id_idx
+                ON summary (result_id) WHERE result_id IS NOT NULL""")
+    # followers carry the leader's id in result_id and move with every status change of the leader,
+    # the claim is released once the leader reaches a terminal status
+    op.execute("""CREATE FUNCTION propagate_summary_status() RETURNS trigger AS $$
+                BEGIN
+                    PERFORM 1 FROM summary_claim WHERE leader_id = NEW.id FOR UPDATE;
+                    UPDATE summary SET status = NEW.status
+                        WHERE result_id = NEW.id AND status IS DISTINCT FROM NEW.status;
+                    IF NEW.status IN ('completed', 'failed') THEN
+                        DELETE FROM summary_claim WHERE leader_id = NEW.id;
+                    END IF;
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql""")
+    op.execute("""CREATE TRIGGER summary_status_propagate
+                AFTER UPDATE OF status ON summary
+                FOR EACH ROW
+                WHEN (NEW.result_id IS NULL AND OLD.status IS DISTINCT FROM NEW.status)
+                EXECUTE FUNCTION propagate_summary_status()""")
+
+
+def downgrade() -> None:
+    op.execute('DROP TRIGGER summary_status_propagate ON summary')
+    op.execute('DROP FUNCTION propagate_summary_status()')
+    op.execute('DROP INDEX summary_result_id_idx')
+    op.execute('DROP TABLE summary_claim')
@@ -0,0 +1,40 @@
+"""
+notify Summary status job flag
+
+Revision ID: c4d8f2a61e95
+Revises: b71e3a5c9f28
+Create Date: 2026-10-18 16:52:40.381907
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4d8f2a61e95'
+down_revision: str | None = 'b71e3a5c9f28'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    # the third field tells rows that run their own job (1) apart from rows linked to another result (0)
+    op.execute("""CREATE OR REPLACE FUNCTION notify_summary_status() RETURNS trigger AS $$
+                BEGIN
+                    PERFORM pg_notify(
+                        'summary_status',
+                        NEW.id || ':' || NEW.status || ':' || (NEW.result_id IS NULL)::int
+                    );
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql""")
+
+
+def downgrade() -> None:
+    op.execute("""CREATE OR REPLACE FUNCTION notify_summary_status() RETURNS trigger AS $$
+                BEGIN
+                    PERFORM pg_notify('summary_status', NEW.id || ':' || NEW.status);
+                    RETURN NEW;
+                END;
+                $$ LANGUAGE plpgsql""")
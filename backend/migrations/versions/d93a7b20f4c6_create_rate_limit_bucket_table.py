@@ -0,0 +1,49 @@
+"""
+create rate limit bucket table
+
+Revision ID: d93a7b20f4c6
+Revises: c4d8f2a61e95
+Create Date: 2026-10-18 19:07:12.846203
+
+"""
+
+from collections.abc import Sequence
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = 'd93a7b20f4c6'
+down_revision: str | None = 'c4d8f2a61e95'
+branch_labels: str | Sequence[str] | None = None
+depends_on: str | Sequence[str] | None = None
+
+
+def upgrade() -> None:
+    op.execute("""CREATE TABLE rate_limit_bucket(
+                name TEXT PRIMARY KEY,
+                tokens DOUBLE PRECISION NOT NULL,
+                updated_at TIMESTAMPTZ DEFAULT clock_timestamp() NOT NULL
+                )""")
+    # refill for the time since the last take and take up to `wanted` whole tokens under the row lock, so every
+    # replica draws from the same bucket. With nothing granted, wait_seconds is how long until the next token
+    op.execute("""CREATE FUNCTION take_rate_limit_tokens(
+                    bucket TEXT, rate DOUBLE PRECISION, burst DOUBLE PRECISION, wanted INTEGER,
+                    OUT granted INTEGER, OUT wait_seconds DOUBLE PRECISION
+                ) AS $$
+                DECLARE
+                    available DOUBLE PRECISION;
+                BEGIN
+                    INSERT INTO rate_limit_bucket (name, tokens) VALUES (bucket, burst) ON CONFLICT (name) DO NOTHING;
+                    SELECT LEAST(burst, tokens + GREATEST(EXTRACT(EPOCH FROM clock_timestamp() - updated_at), 0) * rate)
+                        INTO available FROM rate_limit_bucket WHERE name = bucket FOR UPDATE;
+                    granted := LEAST(FLOOR(available)::int, wanted);
+                    UPDATE rate_limit_bucket SET tokens = available - granted, updated_at = clock_timestamp()
+                        WHERE name = bucket;
+                    wait_seconds := CASE WHEN granted > 0 THEN 0 ELSE (1 - available) / rate END;
+                END;
+                $$ LANGUAGE plpgsql""")
+
+
+def downgrade() -> None:
+    op.execute('DROP FUNCTION take_rate_limit_tokens(TEXT, DOUBLE PRECISION, DOUBLE PRECISION, INTEGER)')
+    op.execute('DROP TABLE rate_limit_bucket')
@@ -1,13 +1,17 @@
 from __future__ import annotations
 
 from datetime import datetime
+from typing import ClassVar
 
+from psycopg2 import sql
 from psycopg2.errors import NoDataFound
 from psycopg2.extensions import connection
+from psycopg2.extras import execute_values
 from pydantic import BaseModel
 
 from enums.main_server import Status
-from errors.exceptions import SummaryNotFoundException
+from errors.exceptions import OutstandingLimitException, SummaryNotFoundException
+from metrics.prometheus import STATUS_TRANSITIONS, observe_query
 
 
 class Summary(BaseModel):
@@ -16,31 +20,321 @@ class Summary(BaseModel):
     isbn: str
     status: str
     creation_date: datetime
+    language: str | None = None
+    model: str | None = None
+    isbn13: str | None = None
+    result_id: int | None = None
 
-    def __init__(self, id: int, ekz_user: str, isbn: str, status: str, creation_date: datetime):
-        super().__init__(id=id, ekz_user=ekz_user, isbn=isbn, status=status, creation_date=creation_date)
+    def __init__(
+        self,
+        id: int,
+        ekz_user: str,
+        isbn: str,
+        status: str,
+        creation_date: datetime,
+        language: str | None = None,
+        model: str | None = None,
+        isbn13: str | None = None,
+        result_id: int | None = None,
+    ):
+        super().__init__(
+            id=id,
+            ekz_user=ekz_user,
+            isbn=isbn,
+            status=status,
+            creation_date=creation_date,
+            language=language,
+            model=model,
+            isbn13=isbn13,
+            result_id=result_id,
+        )
 
     @classmethod
-    def create(cls, db_conn: connection, ekz_user: str, isbn: str) -> Summary:
+    def from_row(cls, row: tuple) -> Summary:
+        """Build a Summary from a row of our own table without running validation again"""
+        return cls.model_construct(**dict(zip(cls.model_fields, row, strict=False)))
+
+    @property
+    def document_id(self) -> int:
+        """metadata_id of the Mongo document holding this summary's data, shared when a result is reused"""
+        return self.result_id or self.id
+
+    @classmethod
+    @observe_query
+    def create(
+        cls,
+        db_conn: connection,
+        ekz_user: str,
+        isbn: str,
+        language: str | None = None,
+        model: str | None = None,
+        isbn13: str | None = None,
+    ) -> Summary:
         stmt = """INSERT INTO Summary
-                    (ekz_user, isbn)
+                    (ekz_user, isbn, language, model, isbn13)
+                    VALUES (%s, %s, %s, %s, %s)
+                    RETURNING
+                    id, ekz_user, isbn, status,
+                    creation_date, language, model,
+                    isbn13, result_id"""
+
+        try:
+            cursor = db_conn.cursor()
+            cursor.execute(stmt, (ekz_user, isbn, language, model, isbn13))
+            summary = cursor.fetchone()
+            db_conn.commit()
+            cursor.close()
+            return Summary.from_row(summary)
+        except Exception as e:
+            db_conn.rollback()
+            raise e
+
+    @classmethod
+    @observe_query
+    def create_or_follow(
+        cls,
+        db_conn: connection,
+        ekz_user: str,
+        isbn: str,
+        language: str,
+        model: str,
+        isbn13: str,
+        claim_ttl_seconds: float,
+        max_outstanding: int = 0,
+    ) -> tuple[Summary, bool]:
+        """
+        Insert a summary and claim its ISBN, language and model key in summary_claim. Without a live claim the
+        new summary becomes the leader and has to be published, otherwise it follows the current leader and the
+        propagate_summary_status trigger moves it along with the leader's status. With max_outstanding set,
+        raises OutstandingLimitException instead when the user's jobs would go over it.
+        """
+        insert_stmt = """INSERT INTO Summary
+                    (ekz_user, isbn, language, model, isbn13)
+                    VALUES (%s, %s, %s, %s, %s)
+                    RETURNING id"""
+        # claims older than the ttl belong to leaders that died without reaching a terminal status
+        claim_stmt = """INSERT INTO summary_claim
+                    (claim_key, leader_id)
                     VALUES (%s, %s)
+                    ON CONFLICT (claim_key) DO UPDATE
+                    SET leader_id = EXCLUDED.leader_id, claimed_at = NOW()
+                    WHERE summary_claim.claimed_at < NOW() - make_interval(secs => %s)
+                    RETURNING leader_id"""
+        leader_stmt = """SELECT leader_id FROM summary_claim
+                    WHERE claim_key = %s
+                    FOR SHARE"""
+        follow_stmt = """UPDATE Summary
+                    SET result_id = %s,
+                    status = (SELECT status FROM Summary WHERE id = %s)
+                    WHERE id = %s"""
+        select_stmt = """SELECT * FROM
+                    Summary WHERE
+                    id = %s"""
+        claim_key = f'{isbn13}:{language}:{model}'
+
+        try:
+            cursor = db_conn.cursor()
+            if max_outstanding > 0:
+                cls._check_outstanding(cursor, ekz_user, 1, max_outstanding)
+            cursor.execute(insert_stmt, (ekz_user, isbn, language, model, isbn13))
+            (id,) = cursor.fetchone()
+            is_leader = False
+            # the claim can disappear between the conflict and the read when the leader just finished
+            for _ in range(3):
+                cursor.execute(claim_stmt, (claim_key, id, claim_ttl_seconds))
+                if cursor.fetchone():
+                    is_leader = True
+                    break
+                cursor.execute(leader_stmt, (claim_key,))
+                leader = cursor.fetchone()
+                if leader:
+                    cursor.execute(follow_stmt, (leader[0], leader[0], id))
+                    break
+            else:
+                is_leader = True
+            cursor.execute(select_stmt, (id,))
+            summary = cursor.fetchone()
+            db_conn.commit()
+            cursor.close()
+            return Summary.from_row(summary), is_leader
+        except Exception as e:
+            db_conn.rollback()
+            raise e
+
+    @classmethod
+    @observe_query
+    def create_many(
+        cls,
+        db_conn: connection,
+        ekz_user: str,
+        items: list[tuple[str, str, str, str, bool]],
+        max_age_seconds: float,
+        claim_ttl_seconds: float,
+        max_outstanding: int = 0,
+    ) -> tuple[list[Summary], set[int], set[int]]:
+        """
+        Batch version of create_from_result and create_or_follow for (isbn, language, model, isbn13, regenerate)
+        items, every step is a single statement over the whole batch. Returns the summaries in input order, the
+        ids that lead a new job and have to be published, and the ids that reused a completed result. Every
+        distinct book, language and model counts as a new job against max_outstanding.
+        """
+        insert_stmt = """INSERT INTO Summary
+                    (ekz_user, isbn, language, model, isbn13)
+                    VALUES %s
+                    RETURNING id"""
+        reuse_stmt = """UPDATE Summary AS s
+                    SET status = 'completed', result_id = r.result_id
+                    FROM (
+                        SELECT n.id, (
+                            SELECT o.id FROM Summary o
+                            WHERE o.isbn13 = n.isbn13 AND o.language = n.language AND o.model = n.model
+                            AND o.status = 'completed' AND o.result_id IS NULL
+                            AND o.creation_date > NOW() - make_interval(secs => %s)
+                            ORDER BY o.creation_date DESC
+                            LIMIT 1
+                        ) AS result_id
+                        FROM Summary n
+                        WHERE n.id = ANY(%s)
+                    ) AS r
+                    WHERE s.id = r.id AND r.result_id IS NOT NULL
+                    RETURNING s.id"""
+        claim_stmt = """INSERT INTO summary_claim
+                    (claim_key, leader_id)
+                    VALUES %s
+                    ON CONFLICT (claim_key) DO UPDATE
+                    SET leader_id = EXCLUDED.leader_id, claimed_at = NOW()
+                    WHERE summary_claim.claimed_at < NOW() - make_interval(secs => {})
+                    RETURNING claim_key"""
+        leader_stmt = """SELECT claim_key, leader_id FROM summary_claim
+                    WHERE claim_key = ANY(%s)
+                    ORDER BY claim_key
+                    FOR SHARE"""
+        follow_stmt = """UPDATE Summary AS s
+                    SET result_id = f.leader_id, status = l.status
+                    FROM (VALUES %s) AS f (id, leader_id)
+                    JOIN Summary l ON l.id = f.leader_id
+                    WHERE s.id = f.id"""
+        select_stmt = """SELECT * FROM Summary
+                    WHERE id = ANY(%s)"""
+
+        try:
+            cursor = db_conn.cursor()
+            if max_outstanding > 0:
+                new_jobs = len({(isbn13 or isbn, language, model) for isbn, language, model, isbn13, _ in items})
+                cls._check_outstanding(cursor, ekz_user, new_jobs, max_outstanding)
+            rows = [(ekz_user, isbn, language, model, isbn13) for isbn, language, model, isbn13, _ in items]
+            ids = [id for (id,) in execute_values(cursor, insert_stmt, rows, page_size=len(rows), fetch=True)]
+
+            reused_ids = set()
+            reusable_ids = [id for id, item in zip(ids, items, strict=True) if not item[4]]
+            if reusable_ids and max_age_seconds > 0:
+                cursor.execute(reuse_stmt, (max_age_seconds, reusable_ids))
+                reused_ids = {id for (id,) in cursor.fetchall()}
+
+            # the first summary of every key in the batch competes for the claim, the rest follow it
+            candidates = {}
+            for id, (_, language, model, isbn13, _) in zip(ids, items, strict=True):
+                if id not in reused_ids:
+                    candidates.setdefault(f'{isbn13}:{language}:{model}', []).append(id)
+
+            leader_ids = set()
+            followers = []
+            if candidates:
+                # claim rows are locked in key order, two batches sharing books in any order can't deadlock
+                claims = sorted((claim_key, ids_for_key[0]) for claim_key, ids_for_key in candidates.items())
+                won = {
+                    claim_key
+                    for (claim_key,) in execute_values(
+                        cursor,
+                        sql.SQL(claim_stmt).format(sql.Literal(claim_ttl_seconds)),
+                        claims,
+                        page_size=len(claims),
+                        fetch=True,
+                    )
+                }
+                lost = sorted(claim_key for claim_key in candidates if claim_key not in won)
+                leaders = {}
+                if lost:
+                    cursor.execute(leader_stmt, (lost,))
+                    leaders = dict(cursor.fetchall())
+                for claim_key, ids_for_key in candidates.items():
+                    # a claim that vanished right after the conflict belonged to a leader that just finished
+                    leader_id = leaders.get(claim_key) if claim_key not in won else None
+                    if leader_id is None:
+                        leader_id = ids_for_key[0]
+                        leader_ids.add(leader_id)
+                    followers.extend((id, leader_id) for id in ids_for_key if id != leader_id)
+            if followers:
+                execute_values(cursor, follow_stmt, followers, page_size=len(followers))
+
+            cursor.execute(select_stmt, (ids,))
+            summaries_by_id = {summary[0]: Summary.from_row(summary) for summary in cursor.fetchall()}
+            db_conn.commit()
+            cursor.close()
+            return [summaries_by_id[id] for id in ids], leader_ids, reused_ids
+        except Exception as e:
+            db_conn.rollback()
+            raise e
+
+    @classmethod
+    @observe_query
+    def update_statuses(cls, db_conn: connection, ids: list[int], status: Status):
+        stmt = """UPDATE Summary
+                  SET status=%s
+                  WHERE id = ANY(%s)"""
+        try:
+            cursor = db_conn.cursor()
+            cursor.execute(stmt, (status.value, ids))
+            db_conn.commit()
+            STATUS_TRANSITIONS.labels(status.value).inc(cursor.rowcount)
+            cursor.close()
+        except Exception:
+            db_conn.rollback()
+            raise
+
+    @classmethod
+    @observe_query
+    def create_from_result(
+        cls,
+        db_conn: connection,
+        ekz_user: str,
+        isbn: str,
+        language: str,
+        model: str,
+        isbn13: str,
+        max_age_seconds: float,
+    ) -> Summary | None:
+        """
+        Insert an already completed summary linked to the newest fresh result for the same book, language and
+        model. Returns None, without inserting anything, when there is no such result.
+        """
+        stmt = """INSERT INTO Summary
+                    (ekz_user, isbn, language, model, isbn13, status, result_id)
+                    SELECT %s, %s, language, model, isbn13, 'completed', id
+                    FROM Summary
+                    WHERE isbn13 = %s AND language = %s AND model = %s
+                    AND status = 'completed' AND result_id IS NULL
+                    AND creation_date > NOW() - make_interval(secs => %s)
+                    ORDER BY creation_date DESC
+                    LIMIT 1
                     RETURNING
                     id, ekz_user, isbn, status,
-                    creation_date"""
+                    creation_date, language, model,
+                    isbn13, result_id"""
 
         try:
             cursor = db_conn.cursor()
-            cursor.execute(stmt, (ekz_user, isbn))
+            cursor.execute(stmt, (ekz_user, isbn, isbn13, language, model, max_age_seconds))
             summary = cursor.fetchone()
             db_conn.commit()
             cursor.close()
-            return Summary(*summary)
+            return Summary.from_row(summary) if summary else None
         except Exception as e:
             db_conn.rollback()
             raise e
 
     @classmethod
+    @observe_query
     def get_by_id(cls, db_conn: connection, id: int) -> Summary:
         stmt = """SELECT * FROM
                     Summary WHERE
@@ -50,13 +344,33 @@ class Summary(BaseModel):
             cursor.execute(stmt, (id,))
             summary = cursor.fetchone()
             cursor.close()
-            return Summary(*summary)
+            if summary is None:
+                raise NoDataFound
+            return Summary.from_row(summary)
         except NoDataFound:
             raise SummaryNotFoundException
         except Exception:
             raise
 
     @classmethod
+    @observe_query
+    def get_by_ids(cls, db_conn: connection, ids: list[int], user_id: str) -> list[Summary]:
+        """The rows among `ids` that belong to the user, ids of other users are left out like missing ones"""
+        stmt = """SELECT * FROM Summary
+                    WHERE id = ANY(%s)
+                    AND ekz_user=%s"""
+        try:
+            cursor = db_conn.cursor()
+            cursor.execute(stmt, (ids, user_id))
+            res = cursor.fetchall()
+            summaries = [Summary.from_row(summary) for summary in res]
+            cursor.close()
+            return summaries
+        except Exception:
+            raise
+
+    @classmethod
+    @observe_query
     def update_status(cls, db_conn: connection, id: int, status: Status):
         stmt = """UPDATE Summary
                   SET status=%s
@@ -65,6 +379,7 @@ class Summary(BaseModel):
             cursor = db_conn.cursor()
             cursor.execute(stmt, (status.value, id))
             db_conn.commit()
+            STATUS_TRANSITIONS.labels(status.value).inc(cursor.rowcount)
             cursor.close()
         except NoDataFound:
             raise SummaryNotFoundException
@@ -72,22 +387,70 @@ class Summary(BaseModel):
             db_conn.rollback()
             raise
 
-    # @classmethod
-    # def get_for_user(cls, db_conn: connection, user_id: str, page: int) -> list[Summary]:
-    #     stmt = """SELECT * FROM Summary
-    #                 WHERE ekz_user=%s
-    #                 OFFSET %s LIMIT 5"""
-    #     try:
-    #         cursor = db_conn.cursor()
-    #         cursor.execute(stmt, (user_id, (page - 1) * 5))
-    #         res = cursor.fetchall()
-    #         summaries = [Summary(*summary) for summary in res]
-    #         cursor.close()
-    #         return summaries
-    #     except Exception:
-    #         raise
+    @classmethod
+    @observe_query
+    def get_statuses(cls, db_conn: connection, ids: list[int]) -> dict[int, str]:
+        stmt = """SELECT id, status FROM Summary
+                    WHERE id = ANY(%s)"""
+        try:
+            cursor = db_conn.cursor()
+            cursor.execute(stmt, (ids,))
+            res = cursor.fetchall()
+            cursor.close()
+            return dict(res)
+        except Exception:
+            raise
+
+    @classmethod
+    def _check_outstanding(cls, cursor, ekz_user: str, new_jobs: int, max_outstanding: int):
+        """
+        Count the user's jobs still going through the workers, rows following another job's result are not
+        counted. The advisory lock is held until the transaction ends, so the next request of the same user counts
+        after the jobs inserted here are committed.
+        """
+        lock_stmt = "SELECT pg_advisory_xact_lock(hashtext('summary_outstanding'), hashtext(%s))"
+        count_stmt = """SELECT count(*) FROM Summary
+                    WHERE ekz_user=%s
+                    AND status NOT IN ('completed', 'failed')
+                    AND result_id IS NULL"""
+        cursor.execute(lock_stmt, (ekz_user,))
+        cursor.execute(count_stmt, (ekz_user,))
+        (outstanding,) = cursor.fetchone()
+        excess = outstanding + new_jobs - max_outstanding
+        if excess > 0:
+            raise OutstandingLimitException(outstanding, excess)
+
+    @classmethod
+    @observe_query
+    def get_page(
+        cls, db_conn: connection, user_id: str, limit: int, before: tuple[datetime, int] | None = None
+    ) -> list[Summary]:
+        """Newest first keyset page, rows strictly older than the (creation_date, id) of `before`"""
+        if before is None:
+            stmt = """SELECT * FROM Summary
+                        WHERE ekz_user=%s
+                        ORDER BY creation_date DESC, id DESC
+                        LIMIT %s"""
+            params = (user_id, limit)
+        else:
+            stmt = """SELECT * FROM Summary
+                        WHERE ekz_user=%s
+                        AND (creation_date, id) < (%s, %s)
+                        ORDER BY creation_date DESC, id DESC
+                        LIMIT %s"""
+            params = (user_id, *before, limit)
+        try:
+            cursor = db_conn.cursor()
+            cursor.execute(stmt, params)
+            res = cursor.fetchall()
+            summaries = [Summary.from_row(summary) for summary in res]
+            cursor.close()
+            return summaries
+        except Exception:
+            raise
 
     @classmethod
+    @observe_query
     def get_all(cls, db_conn: connection, user_id: str) -> list[Summary]:
         stmt = """SELECT * FROM Summary
                     WHERE ekz_user=%s"""
@@ -95,8 +458,93 @@ class Summary(BaseModel):
             cursor = db_conn.cursor()
             cursor.execute(stmt, (user_id,))
             res = cursor.fetchall()
-            summaries = [Summary(*summary) for summary in res]
+            summaries = [Summary.from_row(summary) for summary in res]
             cursor.close()
             return summaries
         except Exception:
             raise
+
+    EXPORT_COLUMNS: ClassVar[tuple[str, ...]] = (
+        'id',
+        'ekz_user',
+        'isbn',
+        'status',
+        'creation_date',
+        'language',
+        'model',
+        'result_id',
+    )
+
+    @classmethod
+    def iter_export_rows(cls, db_conn: connection, user_id: str, batch_size: int):
+        """
+        Yield all of a user's rows, oldest first, as batches of plain tuples in EXPORT_COLUMNS order. A server side
+        cursor keeps only one batch in memory, whatever the size of the history.
+        """
+        stmt = sql.SQL("""SELECT {} FROM Summary
+                    WHERE ekz_user=%s
+                    ORDER BY creation_date, id""").format(cls._select_columns(cls.EXPORT_COLUMNS))
+        cursor = db_conn.cursor(name='summary_export')
+        cursor.itersize = batch_size
+        try:
+            cursor.execute(stmt, (user_id,))
+            while rows := cursor.fetchmany(batch_size):
+                yield rows
+        finally:
+            cursor.close()
+            db_conn.rollback()
+
+    @classmethod
+    def _select_columns(cls, columns: list[str]) -> sql.Composed:
+        return sql.SQL(', ').join(sql.Identifier(column) for column in columns)
+
+    @classmethod
+    @observe_query
+    def get_fields_by_id(cls, db_conn: connection, id: int, columns: list[str]) -> dict:
+        """Like get_by_id but only reads the given columns"""
+        stmt = sql.SQL("""SELECT {} FROM
+                    Summary WHERE
+                    id = %s""").format(cls._select_columns(columns))
+        try:
+            cursor = db_conn.cursor()
+            cursor.execute(stmt, (id,))
+            summary = cursor.fetchone()
+            cursor.close()
+            if summary is None:
+                raise NoDataFound
+            return dict(zip(columns, summary, strict=True))
+        except NoDataFound:
+            raise SummaryNotFoundException
+        except Exception:
+            raise
+
+    @classmethod
+    @observe_query
+    def get_fields_by_ids(cls, db_conn: connection, ids: list[int], user_id: str, columns: list[str]) -> list[dict]:
+        """Like get_by_ids but only reads the given columns"""
+        stmt = sql.SQL("""SELECT {} FROM Summary
+                    WHERE id = ANY(%s)
+                    AND ekz_user=%s""").format(cls._select_columns(columns))
+        try:
+            cursor = db_conn.cursor()
+            cursor.execute(stmt, (ids, user_id))
+            res = cursor.fetchall()
+            cursor.close()
+            return [dict(zip(columns, summary, strict=True)) for summary in res]
+        except Exception:
+            raise
+
+    @classmethod
+    @observe_query
+    def get_all_fields(cls, db_conn: connection, user_id: str, columns: list[str]) -> list[dict]:
+        """Like get_all but only reads the given columns"""
+        stmt = sql.SQL("""SELECT {} FROM Summary
+                    WHERE ekz_user=%s""").format(cls._select_columns(columns))
+        try:
+            cursor = db_conn.cursor()
+            cursor.execute(stmt, (user_id,))
+            res = cursor.fetchall()
+            cursor.close()
+            return [dict(zip(columns, summary, strict=True)) for summary in res]
+        except Exception:
+            raise
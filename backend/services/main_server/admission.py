@@ -0,0 +1,135 @@
+import asyncio
+import contextlib
+import math
+import time
+from collections import deque
+
+from publisher import RabbitMQPublisher
+
+from metrics.prometheus import ADMISSION_DECISIONS, ADMISSION_QUEUE_DEPTH, ADMISSION_REFRESH_FAILURES
+
+# the status a worker sets when it takes a job off the queue, used to measure how fast each queue drains
+QUEUE_CONSUMED_STATUS = {
+    'scraper': 'collecting_data',
+    'ai-summary': 'generating_summary',
+}
+
+
+class AdmissionController:
+    """
+    Turns new summary jobs away while the worker queues, or the user's own share of them, are over their limits.
+
+    Queue depths are refreshed in the background from RabbitMQ. Drain rates come from the status notifications of
+    the StatusHub, so the Retry-After handed out is the time the backlog above the limit needs to clear at the rate
+    the workers are actually managing.
+
+    The user's share is checked by the Summary model in the transaction that inserts the jobs, under a per-user
+    advisory lock, so concurrent requests of one user can't all pass on the same count. Batches have their own,
+    larger allowance. They are admitted while the queues are under their limits and may take them over by at most
+    that allowance.
+    """
+
+    def __init__(
+        self,
+        publisher: RabbitMQPublisher,
+        max_queue_depths: dict[str, int],
+        max_outstanding_per_user: int,
+        max_batch_outstanding_per_user: int,
+        refresh_interval: float = 2,
+        throughput_window: float = 300,
+        min_retry_after: int = 1,
+        max_retry_after: int = 600,
+    ):
+        self.publisher = publisher
+        self.max_queue_depths = max_queue_depths
+        self.max_outstanding_per_user = max_outstanding_per_user
+        self.max_batch_outstanding_per_user = max_batch_outstanding_per_user
+        self.refresh_interval = refresh_interval
+        self.throughput_window = throughput_window
+        self.min_retry_after = min_retry_after
+        self.max_retry_after = max_retry_after
+        self.queue_depths: dict[str, int] = dict.fromkeys(max_queue_depths, 0)
+        self._consumed: dict[str, deque[float]] = {queue: deque() for queue in max_queue_depths}
+        self._completed: deque[float] = deque()
+        self._task: asyncio.Task | None = None
+
+    def on_status(self, summary_id: int, status: str, is_job: bool):
+        """StatusHub listener, only rows that run their own job say anything about worker throughput"""
+        if not is_job:
+            return
+        now = time.monotonic()
+        for queue, consumed_status in QUEUE_CONSUMED_STATUS.items():
+            if status == consumed_status and queue in self._consumed:
+                self._consumed[queue].append(now)
+        if status in ('completed', 'failed'):
+            self._completed.append(now)
+
+    def _rate(self, events: deque[float]) -> float:
+        """Events per second over the throughput window"""
+        horizon = time.monotonic() - self.throughput_window
+        while events and events[0] < horizon:
+            events.popleft()
+        return len(events) / self.throughput_window
+
+    def _retry_after(self, excess: int, rate: float) -> int:
+        if rate <= 0:
+            return self.max_retry_after
+        return min(max(math.ceil(excess / rate), self.min_retry_after), self.max_retry_after)
+
+    @property
+    def max_batch_jobs(self) -> int | None:
+        """The most distinct jobs a batch can ever be admitted with, None without any limit"""
+        return self.max_batch_outstanding_per_user if self.max_batch_outstanding_per_user > 0 else None
+
+    def user_limit(self, batch: bool = False) -> int:
+        """Outstanding jobs a user may have with the new ones included, 0 for no limit"""
+        return self.max_batch_outstanding_per_user if batch else self.max_outstanding_per_user
+
+    def check_queues(self) -> int | None:
+        """None while every queue has room, otherwise the number of seconds the client should wait"""
+        retry_after = None
+        for queue, max_depth in self.max_queue_depths.items():
+            if max_depth <= 0:
+                continue
+            excess = self.queue_depths[queue] + 1 - max_depth
+            if excess > 0:
+                queue_retry_after = self._retry_after(excess, self._rate(self._consumed[queue]))
+                retry_after = max(retry_after or 0, queue_retry_after)
+        if retry_after is not None:
+            ADMISSION_DECISIONS.labels('queue_depth').inc()
+        return retry_after
+
+    def over_user_limit(self, outstanding: int, excess: int) -> int:
+        """Seconds a user over their limit should wait, from an OutstandingLimitException of the insert"""
+        ADMISSION_DECISIONS.labels('user_limit').inc()
+        # with FIFO queues the user's jobs finish at about their share of the overall completion rate
+        backlog = max(max(self.queue_depths.values(), default=0), outstanding, 1)
+        return self._retry_after(excess, self._rate(self._completed) * outstanding / backlog)
+
+    def admitted(self, new_jobs: int):
+        ADMISSION_DECISIONS.labels('admitted').inc()
+        # count the new jobs right away, otherwise a burst gets through before the next refresh notices it
+        if 'scraper' in self.queue_depths:
+            self.queue_depths['scraper'] += new_jobs
+            ADMISSION_QUEUE_DEPTH.labels('scraper').set(self.queue_depths['scraper'])
+
+    async def _refresh(self):
+        while True:
+            try:
+                self.queue_depths.update(await self.publisher.queue_depths(list(self.max_queue_depths)))
+                for queue, depth in self.queue_depths.items():
+                    ADMISSION_QUEUE_DEPTH.labels(queue).set(depth)
+            except Exception as e:
+                # keep deciding on the last known depths until the broker answers again
+                ADMISSION_REFRESH_FAILURES.inc()
+                print(f'Error reading queue depths: {e}')
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._refresh())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+
+import jwt
+import requests
+from jwt.algorithms import RSAAlgorithm
+
+from metrics.prometheus import JWKS_KEY_LOOKUPS, JWKS_REFRESHES, TOKEN_CACHE_EVICTIONS, TOKEN_CACHE_LOOKUPS
+
+
+class JwksKeyStore:
+    """In-process cache of the Auth0 signing keys, parsed once and refreshed in the background"""
+
+    def __init__(self, jwks_url: str, ttl: float = 600, min_refresh_interval: float = 30, timeout: float = 5):
+        self.jwks_url = jwks_url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._fetched_at = 0.0
+        # the first lookup fetches right away, however little the monotonic clock has run
+        self._last_attempt = float('-inf')
+        self._refresh_task: asyncio.Task | None = None
+
+    def _fetch(self) -> dict:
+        response = requests.get(self.jwks_url, timeout=self.timeout)
+        response.raise_for_status()
+        return {key['kid']: RSAAlgorithm.from_jwk(key) for key in response.json()['keys'] if key.get('kid')}
+
+    async def _do_refresh(self):
+        self._last_attempt = time.monotonic()
+        try:
+            self._keys = await asyncio.to_thread(self._fetch)
+            self._fetched_at = time.monotonic()
+            JWKS_REFRESHES.labels('ok').inc()
+        except Exception as e:
+            # keep serving the keys we already have, the next request will retry
+            JWKS_REFRESHES.labels('failed').inc()
+            print(f'Error refreshing JWKS from {self.jwks_url}: {e}')
+
+    def _refresh(self) -> asyncio.Task:
+        # single-flight: every caller shares the one in-flight fetch
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._do_refresh())
+        return self._refresh_task
+
+    def _expired(self) -> bool:
+        return time.monotonic() - self._fetched_at > self.ttl
+
+    async def get_key(self, kid: str):
+        key = self._keys.get(kid)
+        if key is not None:
+            JWKS_KEY_LOOKUPS.labels('hit').inc()
+            # stale-while-revalidate, the current request goes on with the cached key. A failed refresh leaves the
+            # keys stale, retries wait out the same interval as forced refreshes so an Auth0 outage isn't hammered
+            if self._expired() and time.monotonic() - self._last_attempt >= self.min_refresh_interval:
+                self._refresh()
+            return key
+
+        JWKS_KEY_LOOKUPS.labels('miss').inc()
+        # unknown kid means a cold store or a key rotation. Forced refreshes are rate limited, an empty store included,
+        # so that neither tokens with made up kids nor an Auth0 outage at startup turn into a flood of requests
+        if time.monotonic() - self._last_attempt >= self.min_refresh_interval:
+            await asyncio.shield(self._refresh())
+        elif self._refresh_task is not None and not self._refresh_task.done():
+            await asyncio.shield(self._refresh_task)
+        return self._keys.get(kid)
+
+
+class VerifiedTokenCache:
+    """Bounded LRU of decoded claims keyed by a digest of the token, entries live until the token's exp"""
+
+    # rough per entry cost of the digest, the tuple and the OrderedDict node on top of the claims
+    ENTRY_OVERHEAD = 256
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[bytes, tuple[dict, float, int]] = OrderedDict()
+        self._bytes = 0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def _remove(self, digest: bytes):
+        _, _, size = self._entries.pop(digest)
+        self._bytes -= size
+
+    def get(self, token: str) -> dict | None:
+        digest = self.digest(token)
+        entry = self._entries.get(digest)
+        if entry is None:
+            TOKEN_CACHE_LOOKUPS.labels('miss').inc()
+            return None
+        claims, exp, _ = entry
+        if exp <= time.time():
+            self._remove(digest)
+            TOKEN_CACHE_LOOKUPS.labels('expired').inc()
+            return None
+        self._entries.move_to_end(digest)
+        TOKEN_CACHE_LOOKUPS.labels('hit').inc()
+        return claims
+
+    def put(self, token: str, claims: dict):
+        exp = claims.get('exp')
+        if not isinstance(exp, int | float) or exp <= time.time():
+            return
+        digest = self.digest(token)
+        size = len(json.dumps(claims, default=str)) + self.ENTRY_OVERHEAD
+        if size > self.max_bytes:
+            return
+        if digest in self._entries:
+            self._remove(digest)
+        self._entries[digest] = (claims, exp, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            TOKEN_CACHE_EVICTIONS.inc()
+
+
+class Authenticator:
+    """Verifies RS256 bearer tokens, a token's signature is only checked the first time it is seen"""
+
+    def __init__(self, key_store: JwksKeyStore, token_cache: VerifiedTokenCache, audience: str, issuer: str):
+        self.key_store = key_store
+        self.token_cache = token_cache
+        self.audience = audience
+        self.issuer = issuer
+
+    async def authenticate(self, token: str) -> dict | None:
+        claims = self.token_cache.get(token)
+        if claims is not None:
+            return claims
+
+        unverified_header = jwt.get_unverified_header(token)
+        public_key = await self.key_store.get_key(unverified_header.get('kid'))
+        if public_key is None:
+            return None
+
+        claims = jwt.decode(
+            token,
+            public_key,
+            algorithms=['RS256'],
+            audience=self.audience,
+            issuer=self.issuer,
+        )
+        self.token_cache.put(token, claims)
+        return claims
@@ -0,0 +1,49 @@
+from postgres import PostgresPool
+from result_reuse import ResultReuse
+
+from metrics.prometheus import JOB_COALESCING
+from models.postgres_metadata import Summary
+
+
+class JobCoalescer:
+    """
+    Deduplicates in-flight summary jobs for the same ISBN, language and model.
+
+    The claim lives in Postgres (summary_claim), so requests arriving at different main server replicas still
+    attach to the same leader job.
+    """
+
+    def __init__(self, postgres: PostgresPool, claim_ttl_seconds: float):
+        self.postgres = postgres
+        self.claim_ttl_seconds = claim_ttl_seconds
+
+    async def create(
+        self, ekz_user: str, isbn: str, language: str, model: str, isbn13: str, max_outstanding: int = 0
+    ) -> tuple[Summary, bool]:
+        summary, is_leader = await self.postgres.run(
+            Summary.create_or_follow, ekz_user, isbn, language, model, isbn13, self.claim_ttl_seconds, max_outstanding
+        )
+        JOB_COALESCING.labels('leader' if is_leader else 'follower').inc()
+        return summary, is_leader
+
+    async def create_many(
+        self,
+        ekz_user: str,
+        items: list[tuple[str, str, str, str, bool]],
+        result_reuse: ResultReuse,
+        max_outstanding: int = 0,
+    ) -> tuple[list[Summary], set[int]]:
+        """Batch create, returns the summaries in input order and the ids that have to be published"""
+        summaries, leader_ids, reused_ids = await self.postgres.run(
+            Summary.create_many,
+            ekz_user,
+            items,
+            result_reuse.freshness_seconds,
+            self.claim_ttl_seconds,
+            max_outstanding,
+        )
+        forced = sum(1 for item in items if item[4])
+        result_reuse.record(len(reused_ids), len(items) - forced - len(reused_ids), forced)
+        JOB_COALESCING.labels('leader').inc(len(leader_ids))
+        JOB_COALESCING.labels('follower').inc(len(items) - len(reused_ids) - len(leader_ids))
+        return summaries, leader_ids
@@ -0,0 +1,90 @@
+import gzip
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, without it we only offer gzip
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Best of br and gzip the client accepts, honouring q-values"""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding.strip().lower()] = q
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    candidates = [coding for coding in candidates if accepted.get(coding, accepted.get('*', 0)) > 0]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda coding: accepted.get(coding, accepted.get('*', 0)))
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI gzip/brotli compression for complete JSON and text bodies above a size threshold.
+
+    Streaming responses (SSE, NDJSON) are passed through untouched so nothing gets buffered. Vary: Accept-Encoding
+    goes on every JSON and text response and on every 304, compressed or not, so a shared cache never hands one
+    client's encoding to another.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    def compress(self, body: bytes, encoding: str) -> bytes:
+        if encoding == 'br':
+            return brotli.compress(body, quality=self.brotli_quality)
+        return gzip.compress(body, compresslevel=self.gzip_level)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get('accept-encoding', ''))
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message['type'] == 'http.response.start':
+                start_message = message
+                return
+            if start_message is None:
+                await send(message)
+                return
+
+            headers = MutableHeaders(raw=start_message['headers'])
+            body = message.get('body', b'')
+            compressible_type = headers.get('content-type', '').startswith(COMPRESSIBLE_TYPES)
+            # a 304 has no body of its own but stands for one that would have been compressed
+            if compressible_type or start_message['status'] == 304:
+                headers.add_vary_header('Accept-Encoding')
+            compressible = (
+                encoding is not None
+                and not message.get('more_body', False)
+                and len(body) >= self.minimum_size
+                and 'content-encoding' not in headers
+                and compressible_type
+            )
+            if compressible:
+                body = self.compress(body, encoding)
+                headers['Content-Encoding'] = encoding
+                headers['Content-Length'] = str(len(body))
+                message = {**message, 'body': body}
+            await send(start_message)
+            start_message = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,57 @@
+from errors.exceptions import ValidationException
+
+SUMMARY_COLUMNS = ('id', 'ekz_user', 'isbn', 'status', 'creation_date')
+
+DOCUMENT_FIELDS = (
+    'language',
+    'model',
+    'title',
+    'authors',
+    'sources',
+    'content_coverage',
+    'cross_reference',
+    'source_reliability',
+    'generated_summary',
+    'medium_confidence',
+)
+
+# document fields the Postgres row stores as well, answered from the row while a summary has no document yet
+ROW_FIELDS = ('language', 'model')
+
+
+def parse_fields(fields: str | None) -> tuple[list[str], list[str]] | None:
+    """Split a `fields=a,b,c` query value into Postgres columns and Mongo document fields"""
+    if fields is None:
+        return None
+    requested = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in requested if field not in SUMMARY_COLUMNS and field not in DOCUMENT_FIELDS]
+    if not requested or unknown:
+        raise ValidationException(f'fields must be a comma separated list of {", ".join(SUMMARY_COLUMNS + DOCUMENT_FIELDS)}')
+    return (
+        [field for field in SUMMARY_COLUMNS if field in requested],
+        [field for field in DOCUMENT_FIELDS if field in requested],
+    )
+
+
+def with_columns(columns: list[str], *required: str) -> list[str]:
+    """The requested columns plus the ones the handler needs internally"""
+    return [*columns, *(column for column in required if column not in columns)]
+
+
+def row_fields(document_fields) -> list[str]:
+    """The requested document fields that can also be read from the Postgres row"""
+    return [field for field in document_fields if field in ROW_FIELDS]
+
+
+def document_projection(document_fields) -> dict:
+    return {'_id': 0, 'metadata_id': 1, **{field: 1 for field in document_fields}}
+
+
+def select_fields(document: dict | None, document_fields=DOCUMENT_FIELDS, row: dict | None = None) -> dict:
+    """
+    The document fields, falling back to the Postgres row for what it also stores (language and model) while a
+    summary has no document yet
+    """
+    document = document or {}
+    row = row or {}
+    return {field: document[field] if document.get(field) is not None else row.get(field) for field in document_fields}
@@ -1,17 +1,27 @@
 import os
+from contextlib import AsyncExitStack, asynccontextmanager
 
-import jwt
-import psycopg2
-import requests
+from admission import AdmissionController
+from auth import Authenticator, JwksKeyStore, VerifiedTokenCache
+from coalescing import JobCoalescer
+from compression import CompressionMiddleware
 from dotenv import load_dotenv
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
+from fastapi.exception_handlers import http_exception_handler
 from fastapi.middleware.cors import CORSMiddleware
-from jwt.algorithms import RSAAlgorithm
-from jwt.exceptions import PyJWTError
-from pymongo import MongoClient
+from mongo import MongoStore
+from postgres import PostgresPool
+from publisher import RabbitMQPublisher
+from request_context import AuthContextMiddleware
+from request_metrics import RequestMetricsMiddleware
+from result_reuse import ResultReuse
 from router import router
+from status_hub import StatusHub
+from summary_cache import CompletedSummaryCache
 
-from errors.http import UnAuthenticatedError
+from errors.exceptions import DatabaseBusyException, DatabaseTimeoutException
+from errors.http import ServiceUnavailableError
+from metrics.prometheus import metrics_payload
 
 load_dotenv()
 
@@ -20,31 +30,123 @@ jwt_secret = os.getenv('JWT_SECRET')
 
 class Config:
     def __init__(self) -> None:
-        self.db_conn = None
-        self.mongodb_client = None
+        self.postgres = None
+        self.mongo = None
+        self.publisher = None
+        self.status_hub = None
+        self.result_reuse = None
+        self.coalescer = None
+        self.admission = None
+        self.summary_cache = CompletedSummaryCache(
+            max_bytes=int(os.getenv('SUMMARY_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+        )
+        self.sse_heartbeat_interval = float(os.getenv('SSE_HEARTBEAT_INTERVAL', '15'))
+        self.status_max_wait = float(os.getenv('STATUS_MAX_WAIT', '60'))
+        self.batch_max_size = int(os.getenv('BATCH_MAX_SIZE', '1000'))
+        self.export_batch_size = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+        self.auth = None
 
 
 config = Config()
 
-conn = psycopg2.connect(
-    dbname=os.getenv('POSTGRES_DB'),
-    user=os.getenv('POSTGRES_USER'),
-    password=os.getenv('POSTGRES_PASSWORD'),
-    host=os.getenv('PGHOST'),
-    port=os.getenv('PGPORT'),
-)
-config.db_conn = conn
-
-username = os.getenv('MONGODB_USERNAME')
-password = os.getenv('MONGODB_PASSWORD')
-CONNECTION_URI = (
-    os.getenv('MONGODB_BASE_URI').replace('{MONGODB_USERNAME}', username).replace('{MONGODB_PASSWORD}', password)
-)
-mongodb_client = MongoClient(CONNECTION_URI)
-config.mongodb_client = mongodb_client
 
-
-app = FastAPI()
+def mongo_connection_uri() -> str:
+    username = os.getenv('MONGODB_USERNAME')
+    password = os.getenv('MONGODB_PASSWORD')
+    return (
+        os.getenv('MONGODB_BASE_URI').replace('{MONGODB_USERNAME}', username).replace('{MONGODB_PASSWORD}', password)
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Everything that holds connections, threads or tasks is created here rather than at import time, so with several
+    uvicorn workers every process opens its own pools after it has started and closes them again on shutdown. The
+    exit stack unwinds whatever was already started if a later step fails.
+    """
+    async with AsyncExitStack() as stack:
+        config.auth = Authenticator(
+            JwksKeyStore(
+                os.getenv('OAUTH0_JWKS_URL', 'https://dev-7dhk8h5kupq6ieu1.us.auth0.com/.well-known/jwks.json'),
+                ttl=float(os.getenv('JWKS_CACHE_TTL', '600')),
+                min_refresh_interval=float(os.getenv('JWKS_MIN_REFRESH_INTERVAL', '30')),
+            ),
+            VerifiedTokenCache(
+                max_entries=int(os.getenv('TOKEN_CACHE_MAX_ENTRIES', '10000')),
+                max_bytes=int(os.getenv('TOKEN_CACHE_MAX_BYTES', str(16 * 1024 * 1024))),
+            ),
+            audience=os.getenv('OAUTH0_AUDIENCE'),
+            issuer=os.getenv('OAUTH0_ISSUER'),
+        )
+
+        postgres_connect_kwargs = {
+            'dbname': os.getenv('POSTGRES_DB'),
+            'user': os.getenv('POSTGRES_USER'),
+            'password': os.getenv('POSTGRES_PASSWORD'),
+            'host': os.getenv('PGHOST'),
+            'port': os.getenv('PGPORT'),
+        }
+        config.postgres = PostgresPool(
+            min_size=int(os.getenv('POSTGRES_POOL_MIN_SIZE', '1')),
+            max_size=int(os.getenv('POSTGRES_POOL_MAX_SIZE', '10')),
+            acquire_timeout=float(os.getenv('POSTGRES_POOL_ACQUIRE_TIMEOUT', '5')),
+            **postgres_connect_kwargs,
+        )
+        stack.callback(config.postgres.close)
+        config.result_reuse = ResultReuse(
+            config.postgres, freshness_seconds=float(os.getenv('RESULT_REUSE_FRESHNESS_SECONDS', str(7 * 24 * 3600)))
+        )
+        config.coalescer = JobCoalescer(
+            config.postgres, claim_ttl_seconds=float(os.getenv('SUMMARY_CLAIM_TTL_SECONDS', '3600'))
+        )
+
+        config.mongo = MongoStore(
+            mongo_connection_uri(),
+            min_pool_size=int(os.getenv('MONGODB_POOL_MIN_SIZE', '0')),
+            max_pool_size=int(os.getenv('MONGODB_POOL_MAX_SIZE', '50')),
+            query_timeout=float(os.getenv('MONGODB_QUERY_TIMEOUT', '5')),
+        )
+        stack.callback(config.mongo.close)
+
+        config.publisher = RabbitMQPublisher(
+            host=os.getenv('RABBITMQ_HOST'),
+            login=os.getenv('RABBITMQ_USER'),
+            password=os.getenv('RABBITMQ_PASSWORD'),
+            queues=['scraper'],
+            max_connections=int(os.getenv('RABBITMQ_MAX_CONNECTIONS', '2')),
+            max_channels=int(os.getenv('RABBITMQ_MAX_CHANNELS', '10')),
+            confirm_timeout=float(os.getenv('RABBITMQ_CONFIRM_TIMEOUT', '5')),
+        )
+        stack.push_async_callback(config.publisher.close)
+        await config.publisher.start()
+
+        config.status_hub = StatusHub(
+            config.postgres,
+            reconnect_interval=float(os.getenv('STATUS_LISTEN_RECONNECT_INTERVAL', '5')),
+            **postgres_connect_kwargs,
+        )
+        config.admission = AdmissionController(
+            config.publisher,
+            max_queue_depths={
+                'scraper': int(os.getenv('ADMISSION_MAX_SCRAPER_QUEUE_DEPTH', '500')),
+                'ai-summary': int(os.getenv('ADMISSION_MAX_SUMMARY_QUEUE_DEPTH', '200')),
+            },
+            max_outstanding_per_user=int(os.getenv('ADMISSION_MAX_OUTSTANDING_PER_USER', '20')),
+            max_batch_outstanding_per_user=int(os.getenv('ADMISSION_MAX_BATCH_OUTSTANDING_PER_USER', '1000')),
+            refresh_interval=float(os.getenv('ADMISSION_REFRESH_INTERVAL', '2')),
+            throughput_window=float(os.getenv('ADMISSION_THROUGHPUT_WINDOW', '300')),
+            max_retry_after=int(os.getenv('ADMISSION_MAX_RETRY_AFTER', '600')),
+        )
+        config.status_hub.add_listener(config.admission.on_status)
+        config.status_hub.start()
+        stack.push_async_callback(config.status_hub.close)
+        config.admission.start()
+        stack.push_async_callback(config.admission.close)
+        yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 origins = ['*']
 
@@ -54,45 +156,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=['*'],
     allow_headers=['*'],
+    expose_headers=['ETag'],
+)
+
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv('COMPRESSION_MINIMUM_SIZE', '1024')),
+    gzip_level=int(os.getenv('COMPRESSION_GZIP_LEVEL', '6')),
+    brotli_quality=int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4')),
 )
 
 
-@app.middleware('http')
-async def authenticate_user(request: Request, call_next):
-    if request.method == 'OPTIONS' or request.url.path == '/api/health':
-        return await call_next(request)
-    auth_header = request.headers.get('Authorization')
-    if auth_header:
-        token = auth_header.split('Bearer ')[1]
-        try:
-            jwks_url = 'https://dev-7dhk8h5kupq6ieu1.us.auth0.com/.well-known/jwks.json'
-            jwks = requests.get(jwks_url).json()
-
-            unverified_header = jwt.get_unverified_header(token)
-            kid = unverified_header['kid']
-            key = next(k for k in jwks['keys'] if k['kid'] == kid)
-
-            public_key = RSAAlgorithm.from_jwk(key)
-
-            decoded_token = jwt.decode(
-                token,
-                public_key,
-                algorithms=['RS256'],
-                audience=os.getenv('OAUTH0_AUDIENCE'),
-                issuer=os.getenv('OAUTH0_ISSUER'),
-            )
-            request.state.user_id = decoded_token['sub']
-            return await call_next(request)
-        except PyJWTError:
-            pass
-        return UnAuthenticatedError()
-    return UnAuthenticatedError()
-
-
-@app.middleware('http')
-async def config_middleware(request: Request, call_next):
-    request.state.config = config
-    return await call_next(request)
+# added after compression and CORS so it stays outside of them, like the two http middlewares it replaced
+app.add_middleware(AuthContextMiddleware, config=config, public_paths=('/api/health', '/metrics'))
+
+# outermost, rejected and unauthenticated requests are timed as well
+app.add_middleware(RequestMetricsMiddleware)
+
+
+@app.exception_handler(DatabaseBusyException)
+@app.exception_handler(DatabaseTimeoutException)
+async def database_unavailable_handler(request: Request, exc: Exception):
+    return await http_exception_handler(request, ServiceUnavailableError(str(exc)))
 
 
 app.include_router(router, prefix='/api')
+
+
+# outside of /api, the ingress only sends /api to this service, so only in-cluster scrapers reach it
+@app.get('/metrics', include_in_schema=False)
+async def metrics():
+    payload, content_type = metrics_payload()
+    return Response(payload, media_type=content_type)
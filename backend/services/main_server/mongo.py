@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import ExecutionTimeout, WaitQueueTimeoutError
+
+from errors.exceptions import DatabaseTimeoutException
+from metrics.prometheus import MONGO_OPERATION_SECONDS, MONGO_OPERATION_TIMEOUTS
+
+# list views only need the metadata and scores, the scraped sources and the generated text stay behind /status
+SUMMARY_LIST_PROJECTION = {
+    '_id': 0,
+    'metadata_id': 1,
+    'language': 1,
+    'model': 1,
+    'title': 1,
+    'authors': 1,
+    'content_coverage': 1,
+    'cross_reference': 1,
+    'source_reliability': 1,
+    'medium_confidence': 1,
+}
+
+
+class MongoStore:
+    """Async access to the ekz.data collection, every query is bounded by query_timeout"""
+
+    def __init__(self, uri: str, min_pool_size: int, max_pool_size: int, query_timeout: float):
+        self.query_timeout = query_timeout
+        self.client = AsyncIOMotorClient(
+            uri,
+            minPoolSize=min_pool_size,
+            maxPoolSize=max_pool_size,
+            waitQueueTimeoutMS=int(query_timeout * 1000),
+            serverSelectionTimeoutMS=int(query_timeout * 1000),
+        )
+        self.collection = self.client['ekz']['data']
+
+    async def _timed(self, operation: str, query):
+        start = time.perf_counter()
+        try:
+            # maxTimeMS stops the work on the server, wait_for also covers a stalled connection
+            return await asyncio.wait_for(query, self.query_timeout + 1)
+        except (TimeoutError, ExecutionTimeout, WaitQueueTimeoutError):
+            MONGO_OPERATION_TIMEOUTS.labels(operation).inc()
+            raise DatabaseTimeoutException from None
+        finally:
+            MONGO_OPERATION_SECONDS.labels(operation).observe(time.perf_counter() - start)
+
+    async def get_summary_document(self, summary_id: int, projection: dict | None = None) -> dict | None:
+        return await self._timed(
+            'find_one',
+            self.collection.find_one(
+                {'metadata_id': summary_id}, projection, max_time_ms=int(self.query_timeout * 1000)
+            ),
+        )
+
+    async def get_summary_documents(self, summary_ids: list[int], projection: dict | None = None) -> dict[int, dict]:
+        if not summary_ids:
+            return {}
+        cursor = self.collection.find({'metadata_id': {'$in': summary_ids}}, projection).max_time_ms(
+            int(self.query_timeout * 1000)
+        )
+        documents = await self._timed('find', cursor.to_list(length=None))
+        return {doc['metadata_id']: doc for doc in documents}
+
+    def close(self):
+        self.client.close()
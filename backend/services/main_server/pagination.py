@@ -0,0 +1,17 @@
+import base64
+import binascii
+from datetime import datetime
+
+from errors.exceptions import ValidationException
+
+
+def encode_cursor(creation_date: datetime, id: int) -> str:
+    return base64.urlsafe_b64encode(f'{creation_date.isoformat()}|{id}'.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        creation_date, id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(creation_date), int(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValidationException('cursor not valid') from None
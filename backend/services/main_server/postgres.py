@@ -0,0 +1,116 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, suppress
+
+from psycopg2.extensions import connection as PgConnection
+from psycopg2.pool import ThreadedConnectionPool
+
+from errors.exceptions import DatabaseBusyException
+from metrics.prometheus import (
+    POSTGRES_POOL_ACQUIRE_SECONDS,
+    POSTGRES_POOL_ACQUIRE_TIMEOUTS,
+    POSTGRES_POOL_IN_USE,
+    POSTGRES_POOL_SIZE,
+    POSTGRES_POOL_WAITING,
+)
+
+
+class PostgresPool:
+    """Bounded psycopg2 connection pool for the async handlers, queries run on the pool's own threads"""
+
+    def __init__(self, min_size: int, max_size: int, acquire_timeout: float, **connect_kwargs):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self._pool = ThreadedConnectionPool(min_size, max_size, **connect_kwargs)
+        # one thread per connection so a query never waits on the loop's default executor
+        self._executor = ThreadPoolExecutor(max_workers=max_size, thread_name_prefix='postgres')
+        self._slots = asyncio.Semaphore(max_size)
+        # work still running on a connection, a cancelled request's connection is only released once it is done
+        self._running: dict[PgConnection, asyncio.Future] = {}
+        self._releases: set[asyncio.Task] = set()
+        POSTGRES_POOL_SIZE.inc(max_size)
+
+    async def in_thread(self, fn, conn: PgConnection, *args):
+        """Run fn(conn, *args), blocking work on a connection from connection(), on the pool's threads"""
+        future = asyncio.get_running_loop().run_in_executor(self._executor, fn, conn, *args)
+        self._running[conn] = future
+        try:
+            # shielded, cancelling the request can't stop the thread anyway, the release waits for it instead
+            return await asyncio.shield(future)
+        finally:
+            if future.done():
+                del self._running[conn]
+
+    @asynccontextmanager
+    async def connection(self):
+        start = time.perf_counter()
+        POSTGRES_POOL_WAITING.inc()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except TimeoutError:
+            POSTGRES_POOL_ACQUIRE_TIMEOUTS.inc()
+            raise DatabaseBusyException from None
+        finally:
+            POSTGRES_POOL_WAITING.dec()
+
+        POSTGRES_POOL_ACQUIRE_SECONDS.observe(time.perf_counter() - start)
+        # from here on the slot goes back together with the connection, in _release
+        getconn = asyncio.get_running_loop().run_in_executor(self._executor, self._pool.getconn)
+        try:
+            conn = await asyncio.shield(getconn)
+        except asyncio.CancelledError:
+            # getconn carries on in its thread, the connection it hands out goes straight back
+            self._in_background(self._release_unused(getconn))
+            raise
+        except Exception:
+            self._slots.release()
+            raise
+        POSTGRES_POOL_IN_USE.inc()
+        try:
+            yield conn
+        finally:
+            POSTGRES_POOL_IN_USE.dec()
+            # shielded, a cancelled request still hands its connection back to the pool
+            await asyncio.shield(self._in_background(self._release(conn)))
+
+    def _in_background(self, coro) -> asyncio.Task:
+        # releases outlive the request that started them, the set keeps them from being collected
+        task = asyncio.create_task(coro)
+        self._releases.add(task)
+        task.add_done_callback(self._releases.discard)
+        return task
+
+    async def _release(self, conn: PgConnection):
+        try:
+            running = self._running.pop(conn, None)
+            if running is not None:
+                # the request was cancelled mid query, another request must not get the connection mid transaction
+                with suppress(Exception):
+                    await running
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._putconn, conn)
+        finally:
+            self._slots.release()
+
+    async def _release_unused(self, getconn: asyncio.Future):
+        try:
+            conn = await getconn
+        except Exception:
+            self._slots.release()
+            return
+        await self._release(conn)
+
+    def _putconn(self, conn: PgConnection):
+        # broken connections are dropped, the pool opens a fresh one on the next getconn
+        self._pool.putconn(conn, close=bool(conn.closed))
+
+    async def run(self, fn, *args):
+        """Run fn(db_conn, *args) with a pooled connection without blocking the event loop"""
+        async with self.connection() as conn:
+            return await self.in_thread(fn, conn, *args)
+
+    def close(self):
+        self._pool.closeall()
+        self._executor.shutdown(wait=False)
+        POSTGRES_POOL_SIZE.dec(self.max_size)
@@ -0,0 +1,128 @@
+import asyncio
+import time
+
+import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractRobustConnection
+from aio_pika.exceptions import AMQPError, ChannelInvalidStateError
+from aio_pika.pool import Pool
+
+from metrics.prometheus import RABBITMQ_CONFIRMS_IN_FLIGHT, RABBITMQ_MESSAGES, RABBITMQ_PUBLISH_SECONDS
+
+
+class UnconfirmedMessagesError(AMQPError):
+    """Some messages of a publish_many were not confirmed, `failed` holds their indexes into the bodies"""
+
+    reason = '%s of the published messages were not confirmed by the broker'
+
+    def __init__(self, failed: list[int]):
+        self.failed = failed
+        super().__init__(len(failed))
+
+
+class RabbitMQPublisher:
+    """Long lived publisher, connections and channels are pooled and every publish is confirmed by the broker"""
+
+    def __init__(
+        self,
+        host: str,
+        login: str,
+        password: str,
+        queues: list[str],
+        max_connections: int = 2,
+        max_channels: int = 10,
+        confirm_timeout: float = 5,
+    ):
+        self.host = host
+        self.login = login
+        self.password = password
+        self.queues = queues
+        self.max_connections = max_connections
+        self.max_channels = max_channels
+        self.confirm_timeout = confirm_timeout
+        self._connection_pool: Pool[AbstractRobustConnection] | None = None
+        self._channel_pool: Pool[AbstractChannel] | None = None
+
+    async def _get_connection(self) -> AbstractRobustConnection:
+        # robust connections reconnect and restore their channels on their own
+        return await aio_pika.connect_robust(host=self.host, login=self.login, password=self.password)
+
+    async def _get_channel(self) -> AbstractChannel:
+        async with self._connection_pool.acquire() as connection:
+            return await connection.channel(publisher_confirms=True)
+
+    async def start(self):
+        self._connection_pool = Pool(self._get_connection, max_size=self.max_connections)
+        self._channel_pool = Pool(self._get_channel, max_size=self.max_channels)
+        async with self._channel_pool.acquire() as channel:
+            for queue in self.queues:
+                await channel.declare_queue(queue)
+
+    async def _publish_batch(self, routing_key: str, bodies: list[bytes]) -> list:
+        """The confirm, or the exception, of every body"""
+        try:
+            async with self._channel_pool.acquire() as channel:
+                # all messages go out before the first confirm is awaited, so a batch costs one round trip
+                return await asyncio.gather(
+                    *(
+                        channel.default_exchange.publish(
+                            aio_pika.Message(body), routing_key=routing_key, timeout=self.confirm_timeout
+                        )
+                        for body in bodies
+                    ),
+                    return_exceptions=True,
+                )
+        except (AMQPError, ConnectionError, TimeoutError) as e:
+            return [e] * len(bodies)
+
+    async def publish_many(self, routing_key: str, bodies: list[bytes]):
+        """
+        Publish and wait for every confirm. Raises UnconfirmedMessagesError naming the bodies that were not
+        confirmed, the others are queued and must not be published again.
+        """
+        start = time.perf_counter()
+        RABBITMQ_CONFIRMS_IN_FLIGHT.inc(len(bodies))
+        errors: dict[int, BaseException] = {}
+        try:
+            pending = list(range(len(bodies)))
+            for _ in range(2):
+                results = await self._publish_batch(routing_key, [bodies[index] for index in pending])
+                for index, result in zip(pending, results, strict=True):
+                    if isinstance(result, BaseException):
+                        errors[index] = result
+                    else:
+                        errors.pop(index, None)
+                # the pooled channel died underneath us, what it failed on is retried once on a freshly restored one
+                pending = [
+                    index
+                    for index in pending
+                    if isinstance(errors.get(index), (ChannelInvalidStateError, ConnectionError))
+                ]
+                if not pending:
+                    break
+        finally:
+            RABBITMQ_CONFIRMS_IN_FLIGHT.dec(len(bodies))
+            RABBITMQ_PUBLISH_SECONDS.labels(routing_key).observe(time.perf_counter() - start)
+        RABBITMQ_MESSAGES.labels(routing_key, 'confirmed').inc(len(bodies) - len(errors))
+        if errors:
+            RABBITMQ_MESSAGES.labels(routing_key, 'failed').inc(len(errors))
+            failed = sorted(errors)
+            raise UnconfirmedMessagesError(failed) from errors[failed[0]]
+
+    async def publish(self, routing_key: str, body: bytes):
+        await self.publish_many(routing_key, [body])
+
+    async def queue_depths(self, queues: list[str]) -> dict[str, int]:
+        """Number of ready messages per queue, read from the declare-ok of an idempotent redeclare"""
+        depths = {}
+        async with self._channel_pool.acquire() as channel:
+            for queue in queues:
+                # same arguments as the workers use, so a queue nobody has declared yet is created empty
+                declared = await channel.declare_queue(queue)
+                depths[queue] = declared.declaration_result.message_count
+        return depths
+
+    async def close(self):
+        if self._channel_pool is not None:
+            await self._channel_pool.close()
+        if self._connection_pool is not None:
+            await self._connection_pool.close()
@@ -0,0 +1,53 @@
+from jwt.exceptions import PyJWTError
+
+from errors.http import UnAuthenticatedError
+
+BEARER_PREFIX = b'Bearer '
+
+
+class AuthContextMiddleware:
+    """
+    Pure ASGI authentication and request context in one layer.
+
+    The config and the caller's user id are put into scope['state'], which is what request.state reads from. Health
+    checks and CORS preflights go straight through without touching the headers.
+    """
+
+    def __init__(self, app, config, public_paths: tuple[str, ...] = ('/api/health',)):
+        self.app = app
+        self.config = config
+        self.public_paths = frozenset(public_paths)
+
+    @staticmethod
+    def _token(scope) -> str | None:
+        for name, value in scope['headers']:
+            if name == b'authorization':
+                if value.startswith(BEARER_PREFIX):
+                    return value[len(BEARER_PREFIX) :].decode('latin-1')
+                return None
+        return None
+
+    async def _authenticate(self, scope) -> str | None:
+        token = self._token(scope)
+        if not token:
+            return None
+        try:
+            claims = await self.config.auth.authenticate(token)
+        except PyJWTError:
+            return None
+        return claims['sub'] if claims is not None else None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['method'] == 'OPTIONS' or scope['path'] in self.public_paths:
+            await self.app(scope, receive, send)
+            return
+
+        user_id = await self._authenticate(scope)
+        if user_id is None:
+            await UnAuthenticatedError()(scope, receive, send)
+            return
+
+        state = scope.setdefault('state', {})
+        state['config'] = self.config
+        state['user_id'] = user_id
+        await self.app(scope, receive, send)
@@ -0,0 +1,36 @@
+import time
+
+from metrics.prometheus import HTTP_REQUEST_SECONDS
+
+
+class RequestMetricsMiddleware:
+    """
+    Pure ASGI request latency histogram, labelled with the matched route template rather than the raw path so
+    ids in the URL don't turn into one time series each. Requests no route matched share the 'unmatched' label.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # the router leaves the matched route in the scope, streaming responses are timed until their last chunk
+            route = scope.get('route')
+            HTTP_REQUEST_SECONDS.labels(
+                scope['method'], route.path if route is not None else 'unmatched', status
+            ).observe(time.perf_counter() - start)
@@ -0,0 +1,32 @@
+from postgres import PostgresPool
+
+from metrics.prometheus import RESULT_REUSE_LOOKUPS
+from models.postgres_metadata import Summary
+
+
+class ResultReuse:
+    """Answers a summary request with a fresh completed result for the same book, language and model"""
+
+    def __init__(self, postgres: PostgresPool, freshness_seconds: float):
+        self.postgres = postgres
+        self.freshness_seconds = freshness_seconds
+
+    async def reuse(
+        self, ekz_user: str, isbn: str, language: str, model: str, isbn13: str, regenerate: bool = False
+    ) -> Summary | None:
+        if regenerate:
+            RESULT_REUSE_LOOKUPS.labels('forced').inc()
+            return None
+        if self.freshness_seconds <= 0:
+            RESULT_REUSE_LOOKUPS.labels('miss').inc()
+            return None
+        summary = await self.postgres.run(
+            Summary.create_from_result, ekz_user, isbn, language, model, isbn13, self.freshness_seconds
+        )
+        RESULT_REUSE_LOOKUPS.labels('miss' if summary is None else 'hit').inc()
+        return summary
+
+    def record(self, hits: int, misses: int, forced: int):
+        RESULT_REUSE_LOOKUPS.labels('hit').inc(hits)
+        RESULT_REUSE_LOOKUPS.labels('miss').inc(misses)
+        RESULT_REUSE_LOOKUPS.labels('forced').inc(forced)
@@ -1,22 +1,43 @@
-import os
+import asyncio
+import threading
+from contextlib import closing
 
-import pika
+from aio_pika.exceptions import AMQPError
 from dotenv import load_dotenv
 from fastapi import Request
+from fastapi.responses import StreamingResponse
 from fastapi.routing import APIRouter
+from fields import document_projection, parse_fields, row_fields, select_fields, with_columns
+from mongo import SUMMARY_LIST_PROJECTION
+from pagination import decode_cursor, encode_cursor
+from publisher import UnconfirmedMessagesError
 from pydantic import BaseModel
+from serialization import FastJSONResponse, dumps
+from status_hub import TERMINAL_STATUSES
+from summary_cache import conditional_response, make_etag
 
-from errors.exceptions import SummaryNotFoundException, ValidationException
-from errors.http import SummaryNotFoundError, ValidationError
+from enums.main_server import Status
+from errors.exceptions import OutstandingLimitException, SummaryNotFoundException, ValidationException
+from errors.http import ServiceUnavailableError, SummaryNotFoundError, TooManyRequestsError, ValidationError
 from models.postgres_metadata import Summary
 from models.scraper_worker import ScraperJob
-from validators.main_server import validate_id, validate_summary_creation_body
+from validators.isbn import canonical_isbn13
+from validators.main_server import (
+    validate_batch_size,
+    validate_id,
+    validate_limit,
+    validate_summary_creation_body,
+    validate_wait,
+)
 
 load_dotenv()
 
 
 router = APIRouter()
 
+# exports whose reader is still winding down after the client went away, kept so the tasks aren't collected
+_export_feeds: set[asyncio.Task] = set()
+
 
 @router.get('/health')
 async def health_check():
@@ -24,42 +45,190 @@ async def health_check():
 
 
 @router.get('/status/{task_id}')
-async def get_data_source(
-    request: Request,
-    task_id: int,
-):
+async def get_data_source(request: Request, task_id: int, fields: str | None = None, wait: float = 0):
     try:
         validate_id(task_id)
-        summary = Summary.get_by_id(request.state.config.db_conn, task_id)
-        if summary.status != 'completed':
-            return summary
-        mongodb_client = request.state.config.mongodb_client
-        db = mongodb_client['ekz']
-        collection = db['data']
-        summary_document = collection.find_one({'metadata_id': task_id})
-        return {
-            **summary.model_dump(),
-            'language': summary_document['language'],
-            'model': summary_document['model'],
-            'title': summary_document['title'],
-            'authors': summary_document['authors'],
-            'sources': summary_document['sources'],
-            'content_coverage': summary_document['content_coverage'],
-            'cross_reference': summary_document['cross_reference'],
-            'source_reliability': summary_document['source_reliability'],
-            'generated_summary': summary_document['generated_summary'],
-            'medium_confidence': summary_document['medium_confidence'],
-        }
+        validate_wait(wait, request.state.config.status_max_wait)
+        selected = parse_fields(fields)
+        config = request.state.config
+
+        # completed summaries never change, a cached copy answers without touching either database
+        cache_key = (task_id, selected and tuple(map(tuple, selected)))
+        cached = config.summary_cache.get(cache_key)
+        if cached is not None:
+            return conditional_response(request, *cached)
+
+        async def read_status() -> tuple[str, Summary | dict]:
+            if selected is None:
+                summary = await config.postgres.run(Summary.get_by_id, task_id)
+                if summary.status != 'completed':
+                    return summary.status, summary
+                return summary.status, await completed_summary(config, summary)
+
+            columns, document_fields = selected
+            # status decides whether there is a document to read, even if the client did not ask for it
+            row = await config.postgres.run(
+                Summary.get_fields_by_id,
+                task_id,
+                with_columns(columns, 'status', 'result_id', *row_fields(document_fields)),
+            )
+            response = {column: row[column] for column in columns}
+            if document_fields and row['status'] == 'completed':
+                summary_document = await config.mongo.get_summary_document(
+                    row['result_id'] or task_id, document_projection(document_fields)
+                )
+                response.update(select_fields(summary_document, document_fields, row=row))
+            else:
+                response.update(select_fields(None, row_fields(document_fields), row=row))
+            return row['status'], response
+
+        if not wait:
+            status, response = await read_status()
+        else:
+            # long-poll: park until the status changes or the wait runs out, subscribing first so no change is missed
+            queue = config.status_hub.subscribe(task_id)
+            try:
+                status, response = await read_status()
+                if status not in TERMINAL_STATUSES and await config.status_hub.wait_for_change(queue, status, wait):
+                    status, response = await read_status()
+            finally:
+                config.status_hub.unsubscribe(task_id, queue)
+
+        if status not in TERMINAL_STATUSES:
+            return FastJSONResponse(response)
+        body = dumps(response)
+        etag = config.summary_cache.put(cache_key, body) if status == 'completed' else make_etag(body)
+        return conditional_response(request, etag, body)
+    except ValidationException as e:
+        raise ValidationError(e.validation_error)
+    except SummaryNotFoundException:
+        raise SummaryNotFoundError
+
+
+async def completed_summary(config, summary: Summary) -> dict:
+    summary_document = await config.mongo.get_summary_document(summary.document_id)
+    row = summary.model_dump()
+    return {**row, **select_fields(summary_document, row=row)}
+
+
+def server_sent_event(event: str, data: dict) -> str:
+    return f'event: {event}\ndata: {dumps(data).decode()}\n\n'
+
+
+@router.get('/status/{task_id}/events')
+async def stream_status(request: Request, task_id: int):
+    try:
+        validate_id(task_id)
+        config = request.state.config
+        # subscribe before reading the row so a transition in between can't get lost
+        queue = config.status_hub.subscribe(task_id)
+        try:
+            summary = await config.postgres.run(Summary.get_by_id, task_id)
+        except Exception:
+            config.status_hub.unsubscribe(task_id, queue)
+            raise
     except ValidationException as e:
         raise ValidationError(e.validation_error)
     except SummaryNotFoundException:
         raise SummaryNotFoundError
 
+    async def events():
+        try:
+            status = summary.status
+            yield server_sent_event('status', {'id': task_id, 'status': status})
+            while status not in TERMINAL_STATUSES:
+                try:
+                    new_status = await asyncio.wait_for(queue.get(), config.sse_heartbeat_interval)
+                except TimeoutError:
+                    # comment line, keeps proxies from closing an idle stream
+                    yield ': keep-alive\n\n'
+                    continue
+                if new_status == status:
+                    continue
+                status = new_status
+                yield server_sent_event('status', {'id': task_id, 'status': status})
+            if status == 'completed':
+                summary.status = status
+                yield server_sent_event('summary', await completed_summary(config, summary))
+        finally:
+            config.status_hub.unsubscribe(task_id, queue)
+
+    return StreamingResponse(
+        events(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+class StatusBatchRequest(BaseModel):
+    ids: list[int]
+    fields: str | None = None
+
+
+@router.post('/status/batch')
+async def get_statuses(request: Request, payload: StatusBatchRequest):
+    """
+    Status of many summaries in one round trip, one Postgres query for the rows and one Mongo query for the
+    documents of the completed ones. Ids that don't exist or belong to someone else are listed under `missing`.
+    """
+    try:
+        ekz_user_id = request.state.user_id
+        config = request.state.config
+        ids = list(dict.fromkeys(payload.ids))
+        validate_batch_size(len(ids), config.batch_max_size)
+        for task_id in ids:
+            validate_id(task_id)
+        selected = parse_fields(payload.fields)
+
+        if selected is None:
+            summaries = await config.postgres.run(Summary.get_by_ids, ids, ekz_user_id)
+            completed_ids = [summary.document_id for summary in summaries if summary.status == 'completed']
+            mongo_docs_by_id = await config.mongo.get_summary_documents(completed_ids)
+            responses = {}
+            for summary in summaries:
+                response = summary.model_dump()
+                if summary.status == 'completed':
+                    response.update(select_fields(mongo_docs_by_id.get(summary.document_id), row=response))
+                responses[summary.id] = response
+        else:
+            columns, document_fields = selected
+            rows = await config.postgres.run(
+                Summary.get_fields_by_ids,
+                ids,
+                ekz_user_id,
+                with_columns(columns, 'id', 'status', 'result_id', *row_fields(document_fields)),
+            )
+            mongo_docs_by_id = {}
+            if document_fields:
+                completed_ids = [row['result_id'] or row['id'] for row in rows if row['status'] == 'completed']
+                mongo_docs_by_id = await config.mongo.get_summary_documents(
+                    completed_ids, document_projection(document_fields)
+                )
+            responses = {}
+            for row in rows:
+                response = {column: row[column] for column in columns}
+                if document_fields and row['status'] == 'completed':
+                    document = mongo_docs_by_id.get(row['result_id'] or row['id'])
+                    response.update(select_fields(document, document_fields, row=row))
+                else:
+                    response.update(select_fields(None, row_fields(document_fields), row=row))
+                responses[row['id']] = response
+
+        return FastJSONResponse(
+            {
+                'summaries': [responses[task_id] for task_id in ids if task_id in responses],
+                'missing': [task_id for task_id in ids if task_id not in responses],
+            }
+        )
+    except ValidationException as e:
+        raise ValidationError(e.validation_error)
+
 
 class SummaryRequest(BaseModel):
     isbn: str
     language: str
     model: str
+    regenerate: bool = False
 
 
 @router.post('/')
@@ -67,100 +236,237 @@ async def create_summary(request: Request, payload: SummaryRequest):
     try:
         ekz_user_id = request.state.user_id
         validate_summary_creation_body(payload.isbn, payload.language, payload.model)
-        summary = Summary.create(request.state.config.db_conn, ekz_user_id, payload.isbn)
-        rabbitmq_client = pika.BlockingConnection(
-            pika.ConnectionParameters(
-                host=os.getenv('RABBITMQ_HOST'),
-                credentials=pika.PlainCredentials(os.getenv('RABBITMQ_USER'), os.getenv('RABBITMQ_PASSWORD')),
-            )
-        )
-        channel = rabbitmq_client.channel()
-        channel.queue_declare(queue='scraper')
-        channel.basic_publish(
-            exchange='',
-            routing_key='scraper',
-            body=ScraperJob(
-                id=summary.id, isbn=payload.isbn, model=payload.model, language=payload.language
-            ).model_dump_json(),
+        isbn13 = canonical_isbn13(payload.isbn)
+        summary = await request.state.config.result_reuse.reuse(
+            ekz_user_id, payload.isbn, payload.language, payload.model, isbn13, payload.regenerate
         )
+        if summary is not None:
+            return summary
+
+        admission = request.state.config.admission
+        retry_after = admission.check_queues()
+        if retry_after is not None:
+            raise TooManyRequestsError('Too many summary jobs queued, try again later', retry_after)
+
+        try:
+            summary, is_leader = await request.state.config.coalescer.create(
+                ekz_user_id, payload.isbn, payload.language, payload.model, isbn13, admission.user_limit()
+            )
+        except OutstandingLimitException as e:
+            raise TooManyRequestsError(
+                'Too many summary jobs queued, try again later', admission.over_user_limit(e.outstanding, e.excess)
+            ) from None
+        admission.admitted(1 if is_leader else 0)
+        if not is_leader:
+            # an identical job is already running, this summary moves along with it
+            return summary
+
+        try:
+            await request.state.config.publisher.publish(
+                'scraper',
+                ScraperJob(
+                    id=summary.id, isbn=payload.isbn, model=payload.model, language=payload.language
+                ).model_dump_json().encode(),
+            )
+        except (AMQPError, ConnectionError, TimeoutError):
+            await request.state.config.postgres.run(Summary.update_status, summary.id, Status.failed)
+            raise ServiceUnavailableError('Could not queue summary job')
         return summary
     except ValidationException as e:
         raise ValidationError(e.validation_error)
 
 
-# @router.get('/pagination/{page}')
-# async def get_summaries(request: Request, page: int):
-#     try:
-#         ekz_user_id = request.state.user_id
-#         validate_page(page)
-#         summaries = Summary.get_for_user(request.state.config.db_conn, ekz_user_id, page)
-#         summary_ids = [summary.id for summary in summaries]
+@router.post('/batch')
+async def create_summaries(request: Request, payload: list[SummaryRequest]):
+    try:
+        ekz_user_id = request.state.user_id
+        config = request.state.config
+        validate_batch_size(len(payload), config.batch_max_size)
+        for index, item in enumerate(payload):
+            try:
+                validate_summary_creation_body(item.isbn, item.language, item.model)
+            except ValidationException as e:
+                raise ValidationException(f'item {index}: {e.validation_error}') from None
+
+        items = [
+            (item.isbn, item.language, item.model, canonical_isbn13(item.isbn), item.regenerate) for item in payload
+        ]
+        # items for the same book, language and model share one job, only distinct ones count against the limits
+        new_jobs = len({(isbn13 or isbn, language, model) for isbn, language, model, isbn13, _ in items})
+        max_batch_jobs = config.admission.max_batch_jobs
+        if max_batch_jobs is not None and new_jobs > max_batch_jobs:
+            raise ValidationException(f'batch may contain at most {max_batch_jobs} different summaries')
+        retry_after = config.admission.check_queues()
+        if retry_after is not None:
+            raise TooManyRequestsError('Too many summary jobs queued, try again later', retry_after)
 
-#         mongodb_client = request.state.config.mongodb_client
-#         db = mongodb_client['ekz']
-#         collection = db['data']
-#         summary_documents = collection.find({'metadata_id': {'$in': summary_ids}})
+        try:
+            summaries, leader_ids = await config.coalescer.create_many(
+                ekz_user_id, items, config.result_reuse, config.admission.user_limit(batch=True)
+            )
+        except OutstandingLimitException as e:
+            raise TooManyRequestsError(
+                'Too many summary jobs queued, try again later',
+                config.admission.over_user_limit(e.outstanding, e.excess),
+            ) from None
+        config.admission.admitted(len(leader_ids))
 
-#         mongo_docs_by_id = {doc['metadata_id']: doc for doc in summary_documents}
+        jobs = [
+            ScraperJob(id=summary.id, isbn=item.isbn, model=item.model, language=item.language)
+            for summary, item in zip(summaries, payload, strict=True)
+            if summary.id in leader_ids
+        ]
+        if jobs:
+            try:
+                await config.publisher.publish_many('scraper', [job.model_dump_json().encode() for job in jobs])
+            except UnconfirmedMessagesError as e:
+                # confirmed jobs are queued and will run, only the others fail, their followers along with them
+                await config.postgres.run(
+                    Summary.update_statuses, [jobs[index].id for index in e.failed], Status.failed
+                )
+                if len(e.failed) == len(jobs):
+                    raise ServiceUnavailableError('Could not queue summary jobs')
+        return {'ids': [summary.id for summary in summaries]}
+    except ValidationException as e:
+        raise ValidationError(e.validation_error)
+
+
+@router.get('/history')
+async def get_history(request: Request, limit: int = 20, cursor: str | None = None):
+    try:
+        ekz_user_id = request.state.user_id
+        validate_limit(limit)
+        before = decode_cursor(cursor) if cursor else None
+        # one extra row tells us whether there is a next page
+        summaries = await request.state.config.postgres.run(Summary.get_page, ekz_user_id, limit + 1, before)
+        next_cursor = None
+        if len(summaries) > limit:
+            summaries = summaries[:limit]
+            next_cursor = encode_cursor(summaries[-1].creation_date, summaries[-1].id)
 
-#         combined_summaries_list = []
-#         for summary in summaries:
-#             mongo_doc = mongo_docs_by_id.get(summary.id)
-#             combined_summary = {
-#                 **summary.model_dump(),
-#                 'language': mongo_doc.get('language'),
-#                 'model': mongo_doc.get('model'),
-#                 'title': mongo_doc.get('title'),
-#                 'authors': mongo_doc.get('authors'),
-#                 'sources': mongo_doc.get('sources'),
-#                 'content_coverage': mongo_doc.get('content_coverage'),
-#                 'cross_reference': mongo_doc.get('cross_reference'),
-#                 'source_reliability': mongo_doc.get('source_reliability'),
-#                 'generated_summary': mongo_doc.get('generated_summary'),
-#                 'medium_confidence': mongo_doc.get('medium_confidence'),
-#             }
+        document_ids = [summary.document_id for summary in summaries]
+        mongo_docs_by_id = await request.state.config.mongo.get_summary_documents(
+            document_ids, SUMMARY_LIST_PROJECTION
+        )
 
-#             combined_summaries_list.append(combined_summary)
+        items = []
+        for summary in summaries:
+            mongo_doc = mongo_docs_by_id.get(summary.document_id, {})
+            row = summary.model_dump()
+            items.append(
+                {
+                    **row,
+                    'language': mongo_doc.get('language') or row['language'],
+                    'model': mongo_doc.get('model') or row['model'],
+                    'title': mongo_doc.get('title'),
+                    'authors': mongo_doc.get('authors'),
+                    'content_coverage': mongo_doc.get('content_coverage'),
+                    'cross_reference': mongo_doc.get('cross_reference'),
+                    'source_reliability': mongo_doc.get('source_reliability'),
+                    'medium_confidence': mongo_doc.get('medium_confidence'),
+                }
+            )
 
-#         return combined_summaries_list
+        return FastJSONResponse({'items': items, 'next_cursor': next_cursor})
 
-#     except ValidationException as e:
-#         raise ValidationError(e.validation_error)
+    except ValidationException as e:
+        raise ValidationError(e.validation_error)
 
 
 @router.get('/all')
-async def get_summaries(request: Request):
+async def get_summaries(request: Request, fields: str | None = None):
     try:
         ekz_user_id = request.state.user_id
-        summaries = Summary.get_all(request.state.config.db_conn, ekz_user_id)
-        summary_ids = [summary.id for summary in summaries]
-        mongodb_client = request.state.config.mongodb_client
-        db = mongodb_client['ekz']
-        collection = db['data']
-        summary_documents = collection.find({'metadata_id': {'$in': summary_ids}})
+        selected = parse_fields(fields)
+        config = request.state.config
+        if selected is None:
+            summaries = await config.postgres.run(Summary.get_all, ekz_user_id)
+            document_ids = [summary.document_id for summary in summaries]
+            mongo_docs_by_id = await config.mongo.get_summary_documents(document_ids)
+            rows = [summary.model_dump() for summary in summaries]
+            return FastJSONResponse(
+                [
+                    {**row, **select_fields(mongo_docs_by_id.get(summary.document_id), row=row)}
+                    for summary, row in zip(summaries, rows, strict=True)
+                ]
+            )
+
+        columns, document_fields = selected
+        rows = await config.postgres.run(
+            Summary.get_all_fields, ekz_user_id, with_columns(columns, 'id', 'result_id', *row_fields(document_fields))
+        )
+        mongo_docs_by_id = {}
+        if document_fields:
+            mongo_docs_by_id = await config.mongo.get_summary_documents(
+                [row['result_id'] or row['id'] for row in rows], document_projection(document_fields)
+            )
+        return FastJSONResponse(
+            [
+                {
+                    **{column: row[column] for column in columns},
+                    **select_fields(mongo_docs_by_id.get(row['result_id'] or row['id']), document_fields, row=row),
+                }
+                for row in rows
+            ]
+        )
 
-        mongo_docs_by_id = {doc['metadata_id']: doc for doc in summary_documents}
+    except ValidationException as e:
+        raise ValidationError(e.validation_error)
 
-        combined_summaries_list = []
-        for summary in summaries:
-            mongo_doc = mongo_docs_by_id.get(summary.id)
-            combined_summary = {
-                **summary.model_dump(),
-                'language': mongo_doc.get('language'),
-                'model': mongo_doc.get('model'),
-                'title': mongo_doc.get('title'),
-                'authors': mongo_doc.get('authors'),
-                'sources': mongo_doc.get('sources'),
-                'content_coverage': mongo_doc.get('content_coverage'),
-                'cross_reference': mongo_doc.get('cross_reference'),
-                'source_reliability': mongo_doc.get('source_reliability'),
-                'generated_summary': mongo_doc.get('generated_summary'),
-                'medium_confidence': mongo_doc.get('medium_confidence'),
-            }
 
-            combined_summaries_list.append(combined_summary)
+@router.get('/export')
+async def export_summaries(request: Request):
+    ekz_user_id = request.state.user_id
+    config = request.state.config
+    id_index = Summary.EXPORT_COLUMNS.index('id')
+    result_id_index = Summary.EXPORT_COLUMNS.index('result_id')
 
-        return combined_summaries_list
+    def read_batches(conn, batches: asyncio.Queue, stop: threading.Event, loop: asyncio.AbstractEventLoop):
+        # the generator, its named cursor and the rollback that ends it all stay on this one pool thread
+        with closing(Summary.iter_export_rows(conn, ekz_user_id, config.export_batch_size)) as rows_iter:
+            for rows in rows_iter:
+                if stop.is_set():
+                    return
+                asyncio.run_coroutine_threadsafe(batches.put(rows), loop).result()
 
-    except ValidationException as e:
-        raise ValidationError(e.validation_error)
+    async def feed(batches: asyncio.Queue, stop: threading.Event):
+        # not tied to the response, the connection goes back to the pool only after read_batches has returned
+        try:
+            async with config.postgres.connection() as conn:
+                await config.postgres.in_thread(read_batches, conn, batches, stop, asyncio.get_running_loop())
+            end = None
+        except Exception as e:
+            end = e
+        if not stop.is_set():
+            await batches.put(end)
+
+    async def records():
+        batches = asyncio.Queue(maxsize=2)
+        stop = threading.Event()
+        task = asyncio.create_task(feed(batches, stop))
+        _export_feeds.add(task)
+        task.add_done_callback(_export_feeds.discard)
+        try:
+            while (rows := await batches.get()) is not None:
+                if isinstance(rows, Exception):
+                    raise rows
+                document_ids = [row[result_id_index] or row[id_index] for row in rows]
+                mongo_docs_by_id = await config.mongo.get_summary_documents(document_ids)
+                yield b''.join(
+                    dumps({**record, **select_fields(mongo_docs_by_id.get(document_id), row=record)}) + b'\n'
+                    for record, document_id in zip(
+                        (dict(zip(Summary.EXPORT_COLUMNS, row, strict=True)) for row in rows), document_ids, strict=True
+                    )
+                )
+        finally:
+            # nothing awaited here, a cancelled stream still stops the reader. Emptying the queue frees a put the
+            # reader may be blocked on, it then sees stop and closes the cursor on its own thread
+            stop.set()
+            while not batches.empty():
+                batches.get_nowait()
+
+    return StreamingResponse(
+        records(),
+        media_type='application/x-ndjson',
+        headers={'Content-Disposition': 'attachment; filename="summaries.ndjson"'},
+    )
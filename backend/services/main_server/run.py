@@ -1,4 +1,35 @@
+import argparse
+import os
+import shutil
+
 import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default=os.getenv('MAIN_SERVER_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('MAIN_SERVER_PORT', '8000')))
+    # 0 means one worker per core, every worker is its own process with its own pools
+    parser.add_argument('--workers', type=int, default=int(os.getenv('MAIN_SERVER_WORKERS', '1')))
+    args = parser.parse_args()
+
+    workers = args.workers or os.cpu_count() or 1
+    multiproc_dir = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if multiproc_dir:
+        # the workers merge their metrics through files in here, leftovers of an earlier run would be counted again
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir)
+    uvicorn.run(
+        'main:app',
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        timeout_graceful_shutdown=float(os.getenv('MAIN_SERVER_GRACEFUL_SHUTDOWN', '30')),
+    )
+
 
 if __name__ == '__main__':
-    uvicorn.run('main:app', host='0.0.0.0', port=8000)
+    main()
@@ -0,0 +1,132 @@
+import asyncio
+import contextlib
+import time
+from collections import defaultdict
+
+import psycopg2
+from postgres import PostgresPool
+from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT, connection
+
+from metrics.prometheus import STATUS_HUB_NOTIFICATIONS, STATUS_HUB_RECONNECTS
+from models.postgres_metadata import Summary
+
+TERMINAL_STATUSES = frozenset({'completed', 'failed'})
+
+STATUS_CHANNEL = 'summary_status'
+
+
+class StatusHub:
+    """
+    Fans summary status changes out to the requests waiting on them.
+
+    The summary_status_notify trigger sends a NOTIFY for every status update. One LISTEN connection per process
+    receives them on the event loop and hands them to per-request queues, so parked requests hold no database
+    resources of their own.
+    """
+
+    def __init__(self, postgres: PostgresPool, reconnect_interval: float = 5, **connect_kwargs):
+        self.postgres = postgres
+        self.reconnect_interval = reconnect_interval
+        self.connect_kwargs = connect_kwargs
+        self._subscribers: dict[int, set[asyncio.Queue]] = defaultdict(set)
+        self._last_status: dict[int, str] = {}
+        self._listeners = []
+        self._task: asyncio.Task | None = None
+
+    def subscribe(self, summary_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        self._subscribers[summary_id].add(queue)
+        return queue
+
+    def unsubscribe(self, summary_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(summary_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[summary_id]
+            self._last_status.pop(summary_id, None)
+
+    def add_listener(self, listener):
+        """listener(summary_id, status, is_job) is called for every status change of any summary"""
+        self._listeners.append(listener)
+
+    def publish(self, summary_id: int, status: str):
+        queues = self._subscribers.get(summary_id)
+        if not queues or self._last_status.get(summary_id) == status:
+            return
+        self._last_status[summary_id] = status
+        for queue in queues:
+            queue.put_nowait(status)
+
+    async def wait_for_change(self, queue: asyncio.Queue, status: str, timeout: float) -> str | None:
+        """The first status different from `status` seen on the queue, None once the timeout expires"""
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                new_status = await asyncio.wait_for(queue.get(), remaining)
+            except TimeoutError:
+                return None
+            if new_status != status:
+                return new_status
+        return None
+
+    def _drain(self, conn: connection, lost: asyncio.Future):
+        try:
+            conn.poll()
+        except psycopg2.Error as e:
+            if not lost.done():
+                lost.set_exception(e)
+            return
+        while conn.notifies:
+            notify = conn.notifies.pop(0)
+            STATUS_HUB_NOTIFICATIONS.inc()
+            summary_id, status, *flags = notify.payload.split(':')
+            self.publish(int(summary_id), status)
+            is_job = not flags or flags[0] == '1'
+            for listener in self._listeners:
+                listener(int(summary_id), status, is_job)
+
+    async def _resync(self):
+        # notifications sent while we were not listening are lost, so re-read everything that is being watched
+        summary_ids = list(self._subscribers)
+        if summary_ids:
+            for summary_id, status in (await self.postgres.run(Summary.get_statuses, summary_ids)).items():
+                self.publish(summary_id, status)
+
+    def _connect(self) -> connection:
+        conn = psycopg2.connect(**self.connect_kwargs)
+        conn.set_isolation_level(ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            cursor.execute(f'LISTEN {STATUS_CHANNEL}')
+        return conn
+
+    async def _listen(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            conn = None
+            try:
+                conn = await asyncio.to_thread(self._connect)
+                lost = loop.create_future()
+                loop.add_reader(conn.fileno(), self._drain, conn, lost)
+                try:
+                    await self._resync()
+                    await lost
+                finally:
+                    loop.remove_reader(conn.fileno())
+            except Exception as e:
+                print(f'Status listener connection lost: {e}')
+            finally:
+                if conn is not None:
+                    conn.close()
+            STATUS_HUB_RECONNECTS.inc()
+            await asyncio.sleep(self.reconnect_interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._listen())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
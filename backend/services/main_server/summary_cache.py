@@ -0,0 +1,66 @@
+import hashlib
+from collections import OrderedDict
+
+from fastapi import Request, Response
+
+from metrics.prometheus import SUMMARY_CACHE_EVICTIONS, SUMMARY_CACHE_LOOKUPS, SUMMARY_CACHE_SIZE_BYTES
+
+# terminal responses never change again, browsers may keep them for a year without revalidating
+TERMINAL_CACHE_CONTROL = 'private, max-age=31536000, immutable'
+
+
+def make_etag(body: bytes) -> str:
+    # weak, the compression middleware sends the same tag with the gzip, br and identity encodings of the body
+    return f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get('if-none-match')
+    if not if_none_match:
+        return False
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    candidates = {candidate.strip().removeprefix('W/') for candidate in if_none_match.split(',')}
+    return '*' in candidates or etag.removeprefix('W/') in candidates
+
+
+def conditional_response(request: Request, etag: str, body: bytes) -> Response:
+    headers = {'ETag': etag, 'Cache-Control': TERMINAL_CACHE_CONTROL}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+class CompletedSummaryCache:
+    """Size bounded LRU of serialized completed summaries with their ETags, keyed by id and fieldset"""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[tuple, tuple[str, bytes]] = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: tuple) -> tuple[str, bytes] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            SUMMARY_CACHE_LOOKUPS.labels('miss').inc()
+            return None
+        self._entries.move_to_end(key)
+        SUMMARY_CACHE_LOOKUPS.labels('hit').inc()
+        return entry
+
+    def put(self, key: tuple, body: bytes) -> str:
+        etag = make_etag(body)
+        if len(body) > self.max_bytes:
+            return etag
+        if key in self._entries:
+            self._resize(-len(self._entries.pop(key)[1]))
+        self._entries[key] = (etag, body)
+        self._resize(len(body))
+        while self._bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._resize(-len(evicted))
+            SUMMARY_CACHE_EVICTIONS.inc()
+        return etag
+
+    def _resize(self, delta: int):
+        self._bytes += delta
+        SUMMARY_CACHE_SIZE_BYTES.inc(delta)
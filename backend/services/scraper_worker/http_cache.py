@@ -0,0 +1,170 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import OrderedDict
+
+import httpx
+
+from metrics.prometheus import HTTP_CACHE_BYTES_SAVED, HTTP_CACHE_REQUESTS, HTTP_CACHE_SIZE_BYTES
+
+# 4 byte big endian length of the JSON header, the header, then the zlib compressed body
+HEADER_LENGTH = struct.Struct('>I')
+# what a cached response is served with, the body is stored decoded so encoding and length don't carry over
+KEPT_HEADERS = ('content-type', 'etag', 'last-modified')
+
+
+def cache_key(method: str, url: str, params: dict | None = None) -> str:
+    url = str(httpx.URL(url).copy_merge_params(sorted((params or {}).items())))
+    return hashlib.sha256(f'{method.upper()} {url}'.encode()).hexdigest()
+
+
+class CachedResponse:
+    def __init__(self, header: dict, body: bytes):
+        self.header = header
+        self.body = body
+
+    @property
+    def fresh(self) -> bool:
+        return time.time() < self.header['expires_at']
+
+    @property
+    def validators(self) -> dict:
+        """Conditional request headers that let the site answer 304 instead of resending the body"""
+        headers = {}
+        if self.header['headers'].get('etag'):
+            headers['If-None-Match'] = self.header['headers']['etag']
+        if self.header['headers'].get('last-modified'):
+            headers['If-Modified-Since'] = self.header['headers']['last-modified']
+        return headers
+
+    def to_response(self, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(self.header['status'], headers=self.header['headers'], content=self.body, request=request)
+
+
+class HttpResponseCache:
+    """
+    On-disk cache of successful GET responses, one zlib compressed file per method+URL+params.
+
+    Entries live for the TTL of their host, a stale entry that carries an ETag or Last-Modified is revalidated with
+    a conditional request instead of being fetched again. The files are read through mmap and evicted least recently
+    used first once the directory grows past max_bytes. The index of sizes is rebuilt from the directory at startup.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_bytes: int,
+        default_ttl: float,
+        host_ttls: dict[str, float] | None = None,
+        compression_level: int = 6,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.host_ttls = host_ttls or {}
+        self.compression_level = compression_level
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._bytes = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f'{key}.cache')
+
+    def _load_index(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.cache'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name.removesuffix('.cache'), stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+        self._evict()
+
+    def ttl(self, host: str) -> float:
+        return self.host_ttls.get(host, self.default_ttl)
+
+    def cacheable(self, method: str, host: str) -> bool:
+        return method.upper() == 'GET' and self.ttl(host) > 0
+
+    def get(self, key: str) -> CachedResponse | None:
+        if key not in self._entries:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                (header_length,) = HEADER_LENGTH.unpack_from(mapped)
+                header_end = HEADER_LENGTH.size + header_length
+                header = json.loads(mapped[HEADER_LENGTH.size : header_end])
+                with memoryview(mapped) as view, view[header_end:] as compressed:
+                    body = zlib.decompress(compressed)
+        except (OSError, ValueError, zlib.error):
+            # removed behind our back or cut short by a crash mid-write, either way it is gone
+            self._forget(key)
+            return None
+        self._entries.move_to_end(key)
+        return CachedResponse(header, body)
+
+    def put(self, key: str, response: httpx.Response, host: str):
+        now = time.time()
+        header = json.dumps(
+            {
+                'url': str(response.request.url),
+                'status': response.status_code,
+                'headers': {name: response.headers[name] for name in KEPT_HEADERS if name in response.headers},
+                'stored_at': now,
+                'expires_at': now + self.ttl(host),
+            }
+        ).encode()
+        data = HEADER_LENGTH.pack(len(header)) + header + zlib.compress(response.content, self.compression_level)
+        if len(data) > self.max_bytes:
+            return
+        path = self._path(key)
+        # written next to the final name and swapped in, readers never see half a file
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._forget(key, delete=False)
+        self._entries[key] = len(data)
+        self._bytes += len(data)
+        self._evict()
+
+    def refresh(self, key: str, cached: CachedResponse, host: str):
+        """The site confirmed the entry with a 304, it is stored again to be good for another TTL"""
+        self.put(key, cached.to_response(httpx.Request('GET', cached.header['url'])), host)
+
+    def _forget(self, key: str, delete: bool = True):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._bytes -= size
+        if delete:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            self._forget(next(iter(self._entries)))
+        HTTP_CACHE_SIZE_BYTES.set(self._bytes)
+
+    def record(self, host: str, result: str, bytes_saved: int = 0):
+        HTTP_CACHE_REQUESTS.labels(host, result).inc()
+        if bytes_saved:
+            HTTP_CACHE_BYTES_SAVED.labels(host).inc(bytes_saved)
+
+
+def parse_host_ttls(value: str) -> dict[str, float]:
+    """`host=seconds,host=seconds` as used by SCRAPER_CACHE_HOST_TTLS"""
+    ttls = {}
+    for part in value.split(','):
+        host, _, seconds = part.strip().partition('=')
+        if host and seconds:
+            ttls[host] = float(seconds)
+    return ttls
+
@@ -0,0 +1,88 @@
+import asyncio
+from collections import defaultdict
+
+import httpx
+from http_cache import HttpResponseCache, cache_key
+from rate_limiter import TokenBucketLimiter
+
+
+class ScraperHttpClient:
+    """
+    One async HTTP client for every scraper of the worker process, so connections, TLS sessions and HTTP/2
+    streams are reused from book to book.
+
+    httpx only bounds the pool as a whole, a semaphore per host keeps one slow site from taking all the connections.
+    Pass a `transport` (httpx.MockTransport, or an ASGI/WSGI transport around a fake site) to run the scrapers
+    without the network. With a `cache`, GET responses are answered from disk while fresh and revalidated once stale.
+    A request given a `limiter` takes a token from it right before it goes out, answers from the cache don't.
+    """
+
+    def __init__(
+        self,
+        max_connections_per_host: int = 4,
+        max_connections: int = 20,
+        connect_timeout: float = 5,
+        read_timeout: float = 15,
+        http2: bool = True,
+        transport: httpx.AsyncBaseTransport | None = None,
+        cache: HttpResponseCache | None = None,
+    ):
+        self.max_connections_per_host = max_connections_per_host
+        self.cache = cache
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            follow_redirects=True,
+            transport=transport,
+        )
+        self._host_slots: dict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(self.max_connections_per_host)
+        )
+
+    async def _send(
+        self, host: str, method: str, url: str, limiter: TokenBucketLimiter | None = None, **kwargs
+    ) -> httpx.Response:
+        if limiter is not None:
+            await limiter.acquire()
+        async with self._host_slots[host]:
+            return await self._client.request(method, url, **kwargs)
+
+    async def request(
+        self, method: str, url: str, limiter: TokenBucketLimiter | None = None, **kwargs
+    ) -> httpx.Response:
+        host = httpx.URL(url).host
+        if self.cache is None or not self.cache.cacheable(method, host):
+            if self.cache is not None:
+                self.cache.record(host, 'bypass')
+            return await self._send(host, method, url, limiter, **kwargs)
+
+        # entries are small and read through mmap, the disk work stays on the loop where the index needs no lock
+        key = cache_key(method, url, kwargs.get('params'))
+        cached = self.cache.get(key)
+        if cached is not None and cached.fresh:
+            self.cache.record(host, 'hit', len(cached.body))
+            return cached.to_response(self._client.build_request(method, url, **kwargs))
+
+        if cached is not None:
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), **cached.validators}
+        response = await self._send(host, method, url, limiter, **kwargs)
+        if cached is not None and response.status_code == 304:
+            self.cache.refresh(key, cached, host)
+            self.cache.record(host, 'revalidated', len(cached.body))
+            return cached.to_response(response.request)
+
+        self.cache.record(host, 'miss')
+        if response.status_code == 200 and 'no-store' not in response.headers.get('cache-control', ''):
+            self.cache.put(key, response, host)
+        return response
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('GET', url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request('POST', url, **kwargs)
+
+    async def aclose(self):
+        await self._client.aclose()
+
@@ -1,30 +1,49 @@
+import asyncio
 import json
 import math
 import os
+import time
 
 import pika
 import psycopg2
 from dotenv import load_dotenv
+from http_cache import HttpResponseCache, parse_host_ttls
+from http_client import ScraperHttpClient
 from pymongo import MongoClient
+from rate_limiter import TokenBucketLimiter
 from scrapers.goodreads import GoodreadsScraper
 from scrapers.isbndb import ISBNdbConfig, ISBNdbScraper
 from scrapers.openlibrary import OpenLibraryScraper
+from source_cache import SourceCache
 from utils import string_cross_reference_similarity
 
 from enums.main_server import Status
+from metrics.prometheus import (
+    MONGO_OPERATION_SECONDS,
+    RABBITMQ_PUBLISH_SECONDS,
+    SCRAPE_JOB_SOURCE_SUM_SECONDS,
+    SCRAPE_JOB_WALL_SECONDS,
+    SCRAPE_SECONDS,
+    start_metrics_server,
+)
 from models.postgres_metadata import Summary
 from models.scraper_worker import ScraperJob
 from models.summary_worker import SummaryJob
 
 load_dotenv()
 
-conn = psycopg2.connect(
-    dbname=os.getenv('POSTGRES_DB'),
-    user=os.getenv('POSTGRES_USER'),
-    password=os.getenv('POSTGRES_PASSWORD'),
-    host=os.getenv('PGHOST'),
-    port=os.getenv('PGPORT'),
-)
+
+def connect_postgres():
+    return psycopg2.connect(
+        dbname=os.getenv('POSTGRES_DB'),
+        user=os.getenv('POSTGRES_USER'),
+        password=os.getenv('POSTGRES_PASSWORD'),
+        host=os.getenv('PGHOST'),
+        port=os.getenv('PGPORT'),
+    )
+
+
+conn = connect_postgres()
 
 username = os.getenv('MONGODB_USERNAME')
 password = os.getenv('MONGODB_PASSWORD')
@@ -35,6 +54,10 @@ mongodb_client = MongoClient(CONNECTION_URI)
 db = mongodb_client['ekz']
 collection = db['data']
 
+# a record found for any edition of the book skips that source's fetch, SOURCE_CACHE_TTL=0 turns the cache off
+SOURCE_CACHE_TTL = int(os.getenv('SOURCE_CACHE_TTL', str(30 * 86400)))
+source_cache = SourceCache(db, ttl=SOURCE_CACHE_TTL) if SOURCE_CACHE_TTL > 0 else None
+
 
 rabbitmq_client = pika.BlockingConnection(
     pika.ConnectionParameters(
@@ -44,73 +67,196 @@ rabbitmq_client = pika.BlockingConnection(
 )
 
 
+SOURCE_TIMEOUTS = {
+    'isbndb': float(os.getenv('SCRAPE_TIMEOUT_ISBNDB', '15')),
+    'openlibrary': float(os.getenv('SCRAPE_TIMEOUT_OPENLIBRARY', '20')),
+    'goodreads': float(os.getenv('SCRAPE_TIMEOUT_GOODREADS', '30')),
+}
+
+# book metadata hardly changes, the same ISBN or title asked again is answered from disk
+http_cache = None
+if os.getenv('SCRAPER_CACHE_DIR'):
+    http_cache = HttpResponseCache(
+        os.getenv('SCRAPER_CACHE_DIR'),
+        max_bytes=int(os.getenv('SCRAPER_CACHE_MAX_BYTES', str(512 * 1024 * 1024))),
+        default_ttl=float(os.getenv('SCRAPER_CACHE_DEFAULT_TTL', '86400')),
+        host_ttls=parse_host_ttls(os.getenv('SCRAPER_CACHE_HOST_TTLS', '')),
+    )
+
+# one loop and one HTTP client for the life of the worker, pika calls scraper_callback on the main thread
+loop = asyncio.new_event_loop()
+http = ScraperHttpClient(
+    max_connections_per_host=int(os.getenv('SCRAPER_MAX_CONNECTIONS_PER_HOST', '4')),
+    max_connections=int(os.getenv('SCRAPER_MAX_CONNECTIONS', '20')),
+    connect_timeout=float(os.getenv('SCRAPER_CONNECT_TIMEOUT', '5')),
+    read_timeout=float(os.getenv('SCRAPER_READ_TIMEOUT', '15')),
+    cache=http_cache,
+)
+
+isbndb_config = ISBNdbConfig(
+    api_key=os.getenv('ISBNDB_API_KEY'),
+    plan='basic',
+)
+# the plan's limit holds across every replica, the limiter keeps its own autocommit connection. By default the
+# bucket holds one second of the plan's requests and a replica leases all of them in one round trip
+ISBNDB_RATE_BURST = float(os.getenv('ISBNDB_RATE_BURST', str(max(1, round(1 / isbndb_config.rate_limit)))))
+isbndb_limiter = TokenBucketLimiter(
+    connect_postgres,
+    'isbndb',
+    rate=1 / isbndb_config.rate_limit,
+    burst=ISBNDB_RATE_BURST,
+    lease_size=int(os.getenv('ISBNDB_RATE_LEASE', str(int(ISBNDB_RATE_BURST)))),
+)
+
+
+async def scrape_isbndb(isbn: str) -> dict | None:
+    scraper = ISBNdbScraper(isbndb_config, http, isbndb_limiter)
+    title, authors, isbndb_result = await scraper.scrape_book(isbn)
+    if not isbndb_result:
+        return None
+    return {
+        'title': title,
+        'authors': authors,
+        'editions': scraper.edition_isbns,
+        'source': {
+            'type': 'isnbd',
+            'url': 'https://isbndb.com/isbndb-api-documentation-v2',
+            'data': isbndb_result,
+            'reliability': 90,
+        },
+    }
+
+
+async def scrape_openlibrary(isbn: str) -> dict | None:
+    scraper = OpenLibraryScraper(http)
+    result = await scraper.scrape_book(isbn)
+    if not result or not result[0]:
+        return None
+    open_library_result, book_url = result
+    return {
+        'title': scraper.title,
+        'authors': [scraper.author] if scraper.author else None,
+        'editions': scraper.edition_isbns,
+        'source': {
+            'type': 'openlibrary',
+            'url': book_url,
+            'data': open_library_result,
+            'reliability': 70,
+        },
+    }
+
+
+async def scrape_goodreads(title: str) -> dict | None:
+    scraper = GoodreadsScraper(http)
+    result = await scraper.scrape_book(title)
+    if not result:
+        return None
+    good_reads_result, book_url = result
+    if not good_reads_result:
+        return None
+    return {
+        'source': {
+            'type': 'goodreads',
+            'url': book_url,
+            'data': good_reads_result,
+            'reliability': 80,
+        },
+    }
+
+
+async def run_source(name: str, timings: dict[str, float], scrape, *args) -> dict | None:
+    """One source with its own timeout, failures and timeouts only cost this source's part of the data"""
+    start = time.perf_counter()
+    outcome = 'error'
+    try:
+        result = await asyncio.wait_for(scrape(*args), SOURCE_TIMEOUTS[name])
+        outcome = 'found' if result else 'empty'
+        return result
+    except TimeoutError:
+        outcome = 'timeout'
+        return None
+    except Exception as e:
+        print(f'Error scraping {name}: {e}')
+        return None
+    finally:
+        timings[name] = time.perf_counter() - start
+        SCRAPE_SECONDS.labels(name, outcome).observe(timings[name])
+
+
+async def collect_sources(isbn: str, cached: dict[str, dict]) -> tuple[dict[str, dict | None], dict[str, float]]:
+    """
+    ISBNdb and OpenLibrary are fetched side by side, Goodreads is searched by title and starts as soon as either
+    of them has one. Sources found in `cached` are not fetched. Results are keyed by source, None for a source
+    that gave nothing.
+    """
+    timings = {}
+    results = dict(cached)
+    tasks = {}
+    for name, scrape in (('isbndb', scrape_isbndb), ('openlibrary', scrape_openlibrary)):
+        if name not in results:
+            tasks[name] = asyncio.ensure_future(run_source(name, timings, scrape, isbn))
+
+    def start_goodreads():
+        title = next((result['title'] for result in results.values() if (result or {}).get('title')), None)
+        if title and 'goodreads' not in results and 'goodreads' not in tasks:
+            tasks['goodreads'] = asyncio.ensure_future(run_source('goodreads', timings, scrape_goodreads, title))
+            pending.add(tasks['goodreads'])
+
+    pending = set(tasks.values())
+    start_goodreads()
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for name, task in tasks.items():
+            if task in done:
+                results[name] = task.result()
+        start_goodreads()
+    return results, timings
+
+
 def scraper_callback(ch, method, properties, body):
     scraper_job = ScraperJob(**json.loads(body))
 
     # update status
     Summary.update_status(conn, scraper_job.id, Status.collecting_data)
 
+    # sources already scraped for any edition of the book
+    cluster, cached = None, {}
+    if source_cache is not None:
+        cluster = source_cache.cluster_of(scraper_job.isbn)
+        cached = source_cache.get(cluster)
+        for name in SOURCE_TIMEOUTS:
+            source_cache.record(name, 'hit' if name in cached else 'miss')
+
     # scrape data
-    sources = {'isnbd': None, 'openlibrary': None, 'goodreads': None}
-    sources = []
+    start = time.perf_counter()
+    results, timings = loop.run_until_complete(collect_sources(scraper_job.isbn, cached))
+    wall = time.perf_counter() - start
+    source_sum = sum(timings.values())
+    SCRAPE_JOB_WALL_SECONDS.observe(wall)
+    SCRAPE_JOB_SOURCE_SUM_SECONDS.observe(source_sum)
+    print(
+        f'Job {scraper_job.id}: sources took {wall:.2f}s, {source_sum:.2f}s one after another '
+        f'({", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())})'
+    )
 
-    # isbndb
-    try:
-        config = ISBNdbConfig(
-            api_key=os.getenv('ISBNDB_API_KEY'),
-            plan='basic',
-        )
-        scraper = ISBNdbScraper(config)
-        title, authors, isbndb_result = scraper.scrape_book(scraper_job.isbn)
-        if isbndb_result:
-            sources.append(
-                {
-                    'type': 'isnbd',
-                    'url': 'https://isbndb.com/isbndb-api-documentation-v2',
-                    'data': isbndb_result,
-                    'reliability': 90,
-                }
-            )
-    except Exception:
-        pass
-
-    # openlibrary
-    try:
-        scraper = OpenLibraryScraper()
-        open_library_result, book_url = scraper.scrape_book(scraper_job.isbn)
-        if open_library_result:
-            sources.append(
-                {
-                    'type': 'openlibrary',
-                    'url': book_url,
-                    'data': open_library_result,
-                    'reliability': 70,
-                }
-            )
-    except Exception:
-        pass
-
-    # goodreads
-    try:
-        scraper = GoodreadsScraper()
-        good_reads_result, book_url = scraper.scrape_book(title)
-        if good_reads_result:
-            sources.append(
-                {
-                    'type': 'goodreads',
-                    'url': book_url,
-                    'data': good_reads_result,
-                    'reliability': 80,
-                }
-            )
-        # check data is there or not and if not change status to failed
-        if not title:
-            Summary.update_status(conn, scraper_job.id, Status.failed)
-            return
-    except Exception:
-        pass
-
-    if len(sources) == 0:
+    if source_cache is not None:
+        editions = []
+        for name, result in results.items():
+            if result and name not in cached:
+                editions.extend(result.pop('editions', None) or [])
+                source_cache.put(cluster, name, result)
+        if editions:
+            source_cache.add_editions(cluster, editions)
+
+    # ISBNdb, OpenLibrary, Goodreads
+    results = [results.get(name) for name in SOURCE_TIMEOUTS]
+    sources = [result['source'] for result in results if result]
+    # ISBNdb is the most reliable source of the title and authors, OpenLibrary fills in when it has nothing
+    title = next((result['title'] for result in results if result and result.get('title')), None)
+    authors = next((result['authors'] for result in results if result and result.get('authors')), None)
+
+    # check data is there or not and if not change status to failed
+    if len(sources) == 0 or not title:
         Summary.update_status(conn, scraper_job.id, Status.failed)
         return
     # calculate metrics
@@ -136,20 +282,21 @@ def scraper_callback(ch, method, properties, body):
     cross_reference = string_cross_reference_similarity([src['data'] for src in sources])
 
     # save to mongodb
-    collection.insert_one(
-        {
-            'metadata_id': scraper_job.id,
-            'language': scraper_job.language,
-            'model': scraper_job.model,
-            'title': title,
-            'authors': authors,
-            'sources': sources,
-            'source_reliability': source_reliability,
-            'content_coverage': content_coverage,
-            'cross_reference': cross_reference,
-            'medium_confidence': math.floor(sum([source_reliability, content_coverage, cross_reference]) / 3),
-        }
-    )
+    with MONGO_OPERATION_SECONDS.labels('insert_one').time():
+        collection.insert_one(
+            {
+                'metadata_id': scraper_job.id,
+                'language': scraper_job.language,
+                'model': scraper_job.model,
+                'title': title,
+                'authors': authors,
+                'sources': sources,
+                'source_reliability': source_reliability,
+                'content_coverage': content_coverage,
+                'cross_reference': cross_reference,
+                'medium_confidence': math.floor(sum([source_reliability, content_coverage, cross_reference]) / 3),
+            }
+        )
 
     # update status
     Summary.update_status(conn, scraper_job.id, Status.data_collected)
@@ -157,23 +304,32 @@ def scraper_callback(ch, method, properties, body):
     # put into summary queue
     channel = rabbitmq_client.channel()
     channel.queue_declare(queue='ai-summary')
-    channel.basic_publish(
-        exchange='',
-        routing_key='ai-summary',
-        body=SummaryJob(
-            id=scraper_job.id,
-            model=scraper_job.model,
-            language=scraper_job.language,
-        ).model_dump_json(),
-    )
+    with RABBITMQ_PUBLISH_SECONDS.labels('ai-summary').time():
+        channel.basic_publish(
+            exchange='',
+            routing_key='ai-summary',
+            body=SummaryJob(
+                id=scraper_job.id,
+                model=scraper_job.model,
+                language=scraper_job.language,
+            ).model_dump_json(),
+        )
 
 
 def main():
+    start_metrics_server(default_port=9100)
+    if source_cache is not None:
+        source_cache.ensure_indexes()
     channel = rabbitmq_client.channel()
     channel.queue_declare(queue='scraper')
     channel.basic_consume(queue='scraper', on_message_callback=scraper_callback, auto_ack=True)
     print(' [*] Waiting for messages...')
-    channel.start_consuming()
+    try:
+        channel.start_consuming()
+    finally:
+        loop.run_until_complete(http.aclose())
+        loop.close()
+        isbndb_limiter.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,93 @@
+import asyncio
+import math
+import time
+from collections.abc import Callable
+
+import psycopg2
+from psycopg2.extensions import connection
+
+from metrics.prometheus import POSTGRES_QUERY_SECONDS, RATE_LIMIT_ACQUIRES, RATE_LIMIT_WAIT_SECONDS
+
+TAKE_TOKENS = 'SELECT granted, wait_seconds FROM take_rate_limit_tokens(%s, %s, %s, %s)'
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket shared by every worker replica through its row in rate_limit_bucket, refilled at `rate` tokens
+    a second up to `burst`.
+
+    A replica takes `lease_size` tokens, or one per waiting caller if more are waiting, in one statement and hands
+    the extra ones out from memory. Leased tokens expire after the time the bucket takes to refill them, so tokens
+    held locally cannot add up into a burst the plan doesn't allow. Callers wait with asyncio.sleep and the
+    statement runs in a thread, the event loop is never blocked. With Postgres unreachable the bucket falls back to
+    this process alone.
+    """
+
+    def __init__(
+        self, connect: Callable[[], connection], name: str, rate: float, burst: float = 1, lease_size: int = 1
+    ):
+        self.connect = connect
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.lease_size = max(1, min(lease_size, math.floor(burst)))
+        self._conn: connection | None = None
+        self._lock = asyncio.Lock()
+        self._waiting = 0
+        self._leased = 0
+        self._lease_expires = 0.0
+        self._local_tokens = burst
+        self._local_updated = time.monotonic()
+
+    async def acquire(self):
+        start = time.perf_counter()
+        self._waiting += 1
+        try:
+            # one caller at a time talks to Postgres, the others queue on the lock without blocking the loop
+            async with self._lock:
+                while True:
+                    if self._leased and time.monotonic() < self._lease_expires:
+                        self._leased -= 1
+                        path = 'local'
+                        break
+                    wanted = max(self.lease_size, min(self._waiting, math.floor(self.burst)))
+                    granted, wait_seconds, path = await self._take(wanted)
+                    if granted:
+                        self._leased = granted - 1
+                        self._lease_expires = time.monotonic() + granted / self.rate
+                        break
+                    await asyncio.sleep(wait_seconds)
+        finally:
+            self._waiting -= 1
+        RATE_LIMIT_WAIT_SECONDS.labels(self.name).observe(time.perf_counter() - start)
+        RATE_LIMIT_ACQUIRES.labels(self.name, path).inc()
+
+    async def _take(self, wanted: int) -> tuple[int, float, str]:
+        try:
+            granted, wait_seconds = await asyncio.to_thread(self._take_from_postgres, wanted)
+            return granted, wait_seconds, 'postgres'
+        except psycopg2.Error as e:
+            print(f'Rate limiter {self.name} is limiting this process only, Postgres failed: {e}')
+            if self._conn is not None and self._conn.closed:
+                self._conn = None
+            return *self._take_locally(wanted), 'fallback'
+
+    def _take_from_postgres(self, wanted: int) -> tuple[int, float]:
+        if self._conn is None:
+            self._conn = self.connect()
+            self._conn.autocommit = True
+        with POSTGRES_QUERY_SECONDS.labels('take_rate_limit_tokens').time(), self._conn.cursor() as cursor:
+            cursor.execute(TAKE_TOKENS, (self.name, self.rate, self.burst, wanted))
+            return cursor.fetchone()
+
+    def _take_locally(self, wanted: int) -> tuple[int, float]:
+        now = time.monotonic()
+        self._local_tokens = min(self.burst, self._local_tokens + (now - self._local_updated) * self.rate)
+        self._local_updated = now
+        granted = min(math.floor(self._local_tokens), wanted)
+        self._local_tokens -= granted
+        return granted, 0 if granted else (1 - self._local_tokens) / self.rate
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
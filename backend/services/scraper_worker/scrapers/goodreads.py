@@ -1,29 +1,26 @@
+import asyncio
 import re
-import time
 from typing import Any
 
-import requests
 from bs4 import BeautifulSoup
+from http_client import ScraperHttpClient
 
 
 class GoodreadsScraper:
-    def __init__(self):
+    def __init__(self, http: ScraperHttpClient):
         self.base_url = 'https://www.goodreads.com'
         self.graphql_url = 'https://kxbwmqov6jgg3daaamb744ycu4.appsync-api.us-east-1.amazonaws.com/graphql'
-        self.session = requests.Session()
-        self.session.headers.update(
-            {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.9',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
-        )
-
-    def search_by_title(self, title: str, author: str = None) -> str | None:
+        self.http = http
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+            'Accept-Language': 'en-US,en;q=0.9',
+            'Accept-Encoding': 'gzip, deflate, br',
+            'DNT': '1',
+            'Upgrade-Insecure-Requests': '1',
+        }
+
+    async def search_by_title(self, title: str, author: str = None) -> str | None:
         """Search for a book by title (and optionally author) and return the book URL."""
         # Construct search query
         search_query = title
@@ -63,7 +60,7 @@ class GoodreadsScraper:
                 }""",
             }
 
-            response = self.session.post(self.graphql_url, json=query)
+            response = await self.http.post(self.graphql_url, json=query, headers=self.headers)
             if response.status_code == 200:
                 data = response.json()
                 edges = data.get('data', {}).get('getSearchSuggestions', {}).get('edges', [])
@@ -91,7 +88,7 @@ class GoodreadsScraper:
             search_url = f'{self.base_url}/search'
             params = {'q': search_query, 'search_type': 'books'}
 
-            response = self.session.get(search_url, params=params)
+            response = await self.http.get(search_url, params=params, headers=self.headers)
             response.raise_for_status()
 
             soup = BeautifulSoup(response.text, 'html.parser')
@@ -136,11 +133,11 @@ class GoodreadsScraper:
             print(f'Error searching for title "{title}": {e}')
             return None
 
-    def get_book_page_html(self, book_url: str) -> str | None:
+    async def get_book_page_html(self, book_url: str) -> str | None:
         """Get the HTML content of a book's main page."""
         try:
             # Add a small delay to be respectful
-            time.sleep(2)
+            await asyncio.sleep(2)
 
             # Update headers for the book page request
             headers = {
@@ -149,12 +146,11 @@ class GoodreadsScraper:
                 'Accept-Language': 'en-US,en;q=0.9',
                 'Accept-Encoding': 'gzip, deflate, br',
                 'DNT': '1',
-                'Connection': 'keep-alive',
                 'Upgrade-Insecure-Requests': '1',
                 'Referer': 'https://www.goodreads.com/',
             }
 
-            response = self.session.get(book_url, headers=headers)
+            response = await self.http.get(book_url, headers=headers)
             response.raise_for_status()
             return response.text
         except Exception as e:
@@ -580,21 +576,21 @@ class GoodreadsScraper:
 
         return '\n'.join(review_parts) if len(review_parts) > 1 else ''
 
-    def scrape_book(self, title: str, author: str = None) -> str | None:
+    async def scrape_book(self, title: str, author: str = None) -> str | None:
         """Main method to scrape book data by title and return formatted string."""
         try:
             # Step 1: Search for the book
-            book_url = self.search_by_title(title, author)
+            book_url = await self.search_by_title(title, author)
             if not book_url:
                 return None
 
             # Step 2: Get the HTML page
-            html = self.get_book_page_html(book_url)
+            html = await self.get_book_page_html(book_url)
             if not html:
                 return None
 
-            # Step 3: Extract data
-            data = self.extract_book_data(html)
+            # Step 3: Extract data, off the event loop so the other sources keep going while the page is parsed
+            data = await asyncio.to_thread(self.extract_book_data, html)
 
             # Step 4: Format for AI
             formatted_data = self.format_for_ai(data)
@@ -1,7 +1,8 @@
-import time
 from dataclasses import dataclass
 
-import requests
+import httpx
+from http_client import ScraperHttpClient
+from rate_limiter import TokenBucketLimiter
 
 
 @dataclass
@@ -33,24 +34,19 @@ class ISBNdbConfig:
 class ISBNdbScraper:
     """Scraper for ISBNdb API to extract book metadata by ISBN"""
 
-    def __init__(self, config: ISBNdbConfig):
+    def __init__(self, config: ISBNdbConfig, http: ScraperHttpClient, limiter: TokenBucketLimiter):
         self.config = config
-        self.session = requests.Session()
-        self.session.headers.update(
-            {'Authorization': config.api_key, 'Accept': 'application/json', 'User-Agent': 'BookScraper/1.0'}
-        )
-        self.last_request_time = 0
-
-    def _make_request(self, endpoint: str, params: dict | None = None) -> dict:
+        self.http = http
+        # shared by every scraper instance and worker replica, built with the plan's rate
+        self.limiter = limiter
+        self.headers = {'Authorization': config.api_key, 'Accept': 'application/json', 'User-Agent': 'BookScraper/1.0'}
+        # the book's own ISBNs and its other_isbns, fed into the edition clusters of the source cache
+        self.edition_isbns: list[str] = []
+
+    async def _make_request(self, endpoint: str, params: dict | None = None) -> dict:
         """Make rate-limited request to ISBNdb API"""
-        # Enforce rate limiting
-        time_since_last = time.time() - self.last_request_time
-        if time_since_last < self.config.rate_limit:
-            time.sleep(self.config.rate_limit - time_since_last)
-
         url = f'{self.config.base_url}{endpoint}'
-        response = self.session.get(url, params=params)
-        self.last_request_time = time.time()
+        response = await self.http.get(url, params=params, headers=self.headers, limiter=self.limiter)
 
         if response.status_code == 404:
             return None
@@ -58,13 +54,13 @@ class ISBNdbScraper:
         response.raise_for_status()
         return response.json()
 
-    def get_book_by_isbn(self, isbn: str, with_prices: bool = False) -> dict | None:
+    async def get_book_by_isbn(self, isbn: str, with_prices: bool = False) -> dict | None:
         """Get book details by ISBN"""
         params = {}
         if with_prices and self.config.plan == 'pro':
             params['with_prices'] = '1'
 
-        result = self._make_request(f'/book/{isbn}', params)
+        result = await self._make_request(f'/book/{isbn}', params)
         return result.get('book') if result else None
 
     def format_book_data_for_ai(self, book_data: dict) -> str:
@@ -189,7 +185,7 @@ class ISBNdbScraper:
 
         return (title, authors, '\n'.join(sections))
 
-    def scrape_book(self, isbn: str, with_prices: bool = False) -> str:
+    async def scrape_book(self, isbn: str, with_prices: bool = False) -> str:
         """
         Main method to scrape book data by ISBN and return formatted string
 
@@ -202,14 +198,17 @@ class ISBNdbScraper:
 
         """
         try:
-            book_data = self.get_book_by_isbn(isbn, with_prices)
+            book_data = await self.get_book_by_isbn(isbn, with_prices)
 
             if not book_data:
                 return None, None, None
 
+            self.edition_isbns = [book_data.get('isbn'), book_data.get('isbn13')] + [
+                other.get('isbn') for other in book_data.get('other_isbns', [])
+            ]
             return self.format_book_data_for_ai(book_data)
 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             return f'Error fetching book data for ISBN {isbn}: {e!s}'
         except Exception as e:
             return f'Unexpected error processing ISBN {isbn}: {e!s}'
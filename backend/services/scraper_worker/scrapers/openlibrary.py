@@ -1,38 +1,40 @@
+import asyncio
 import re
 from typing import Any
 
-import requests
 from bs4 import BeautifulSoup
+from http_client import ScraperHttpClient
 
 
 class OpenLibraryScraper:
-    def __init__(self):
+    def __init__(self, http: ScraperHttpClient):
         self.base_url = 'https://openlibrary.org'
-        self.session = requests.Session()
-        self.session.headers.update(
-            {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-        )
-
-    def search_by_isbn(self, isbn: str) -> str | None:
+        self.http = http
+        # every ISBN OpenLibrary lists for the work, fed into the edition clusters of the source cache
+        self.edition_isbns: list[str] = []
+        self.headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        }
+
+    async def search_by_isbn(self, isbn: str) -> str | None:
         """Search for a book by ISBN and return the work key."""
         search_url = f'{self.base_url}/search.json'
-        params = {'q': isbn}
+        params = {'q': isbn, 'fields': 'key,isbn'}
 
         try:
-            response = self.session.get(search_url, params=params)
+            response = await self.http.get(search_url, params=params, headers=self.headers)
             response.raise_for_status()
             data = response.json()
 
             if data.get('docs') and len(data['docs']) > 0:
+                self.edition_isbns = data['docs'][0].get('isbn', [])
                 return data['docs'][0].get('key')
             return None
         except Exception as e:
             print(f'Error searching for ISBN {isbn}: {e}')
             return None
 
-    def get_book_page_html(self, work_key: str) -> str | None:
+    async def get_book_page_html(self, work_key: str) -> str | None:
         """Get the HTML content of a book's main page."""
         if not work_key.startswith('/works/'):
             work_key = f'/works/{work_key}'
@@ -41,7 +43,7 @@ class OpenLibraryScraper:
         self.book_url = url
 
         try:
-            response = self.session.get(url)
+            response = await self.http.get(url, headers=self.headers)
             response.raise_for_status()
             return response.text
         except Exception as e:
@@ -237,20 +239,22 @@ class OpenLibraryScraper:
 
         return '\n\n'.join(parts)
 
-    def scrape_book(self, isbn: str) -> str | None:
+    async def scrape_book(self, isbn: str) -> str | None:
         """Main method to scrape book data by ISBN and return formatted string."""
         # Step 1: Search for the book
-        work_key = self.search_by_isbn(isbn)
+        work_key = await self.search_by_isbn(isbn)
         if not work_key:
             return None
 
         # Step 2: Get the HTML page
-        html = self.get_book_page_html(work_key)
+        html = await self.get_book_page_html(work_key)
         if not html:
             return None
 
-        # Step 3: Extract data
-        data = self.extract_book_data(html)
+        # Step 3: Extract data, off the event loop so the other sources keep going while the page is parsed
+        data = await asyncio.to_thread(self.extract_book_data, html)
+        self.title = data.get('title')
+        self.author = data.get('author')
 
         # Step 4: Format for AI
         return self.format_for_ai(data), self.book_url
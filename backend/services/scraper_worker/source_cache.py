@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.database import Database
+
+from metrics.prometheus import MONGO_OPERATION_SECONDS, SOURCE_CACHE_LOOKUPS
+from validators.isbn import canonical_isbn13
+
+
+class SourceCache:
+    """
+    Formatted per-source records kept in Mongo against an edition cluster, so any edition of a book that was
+    already scraped is answered without the network.
+
+    Every ISBN is canonicalized to its ISBN-13. `edition_clusters` maps each ISBN-13 to the cluster it was first
+    seen in, the cluster id being the ISBN-13 of the job that started it. ISBNdb's other_isbns and the ISBNs
+    OpenLibrary lists for the work join the cluster as they come in. `source_records` holds one record per cluster
+    and source and expires `ttl` seconds after it was written through a TTL index.
+    """
+
+    def __init__(self, db: Database, ttl: int):
+        self.clusters = db['edition_clusters']
+        self.records = db['source_records']
+        self.ttl = ttl
+
+    def ensure_indexes(self):
+        self.records.create_index([('cluster', ASCENDING), ('source', ASCENDING)], unique=True)
+        ttl_index = self.records.index_information().get('fetched_at_1')
+        if ttl_index is not None and ttl_index.get('expireAfterSeconds') != self.ttl:
+            # SOURCE_CACHE_TTL changed since the index was built, create_index would refuse the new option
+            self.records.database.command(
+                'collMod', self.records.name, index={'keyPattern': {'fetched_at': 1}, 'expireAfterSeconds': self.ttl}
+            )
+        else:
+            self.records.create_index('fetched_at', expireAfterSeconds=self.ttl)
+
+    def cluster_of(self, isbn: str) -> str:
+        """Cluster of any ISBN-10 or ISBN-13 spelling, a book not seen before starts its own"""
+        isbn13 = canonical_isbn13(isbn) or isbn
+        with MONGO_OPERATION_SECONDS.labels('find_one').time():
+            doc = self.clusters.find_one({'_id': isbn13})
+        return doc['cluster'] if doc else isbn13
+
+    def add_editions(self, cluster: str, isbns: list[str | None]):
+        """ISBNs already in a cluster stay where they are, the first cluster to see an edition keeps it"""
+        editions = {canonical_isbn13(isbn) for isbn in isbns if isbn} - {None}
+        editions.add(cluster)
+        updates = [
+            UpdateOne({'_id': isbn13}, {'$setOnInsert': {'cluster': cluster}}, upsert=True) for isbn13 in editions
+        ]
+        with MONGO_OPERATION_SECONDS.labels('bulk_write').time():
+            self.clusters.bulk_write(updates, ordered=False)
+
+    def get(self, cluster: str) -> dict[str, dict]:
+        with MONGO_OPERATION_SECONDS.labels('find').time():
+            docs = list(self.records.find({'cluster': cluster}, {'_id': 0, 'source': 1, 'record': 1}))
+        return {doc['source']: doc['record'] for doc in docs}
+
+    def put(self, cluster: str, source: str, record: dict):
+        with MONGO_OPERATION_SECONDS.labels('update_one').time():
+            self.records.update_one(
+                {'cluster': cluster, 'source': source},
+                {'$set': {'record': record, 'fetched_at': datetime.now(timezone.utc)}},
+                upsert=True,
+            )
+
+    def record(self, source: str, result: str):
+        SOURCE_CACHE_LOOKUPS.labels(source, result).inc()
@@ -10,6 +10,7 @@ from pymongo import MongoClient
 from utils import generate_book_summary
 
 from enums.main_server import Languages, Models, Status
+from metrics.prometheus import MONGO_OPERATION_SECONDS, OLLAMA_GENERATION_SECONDS, start_metrics_server
 from models.postgres_metadata import Summary
 from models.summary_worker import SummaryJob
 
@@ -48,13 +49,16 @@ def ai_summary_callback(ch, method, properties, body):
     Summary.update_status(conn, summary_job.id, Status.generating_summary)
 
     # read source data from mongodb
-    summary_document = collection.find_one({'metadata_id': summary_job.id})
+    with MONGO_OPERATION_SECONDS.labels('find_one').time():
+        summary_document = collection.find_one({'metadata_id': summary_job.id})
 
     # make request to ai summary engine
     language = Languages[summary_document['language']]
     model = Models[summary_document['model']]
     sources = summary_document['sources']
     ollama_model_name, characters_size = Models.get_model_name_and_char(model)
+    start = time.perf_counter()
+    outcome = 'error'
     try:
         summary = generate_book_summary(
             prompt='Please create a detailed book summary',
@@ -64,15 +68,19 @@ def ai_summary_callback(ch, method, properties, body):
             model=ollama_model_name,
             ollama_host=os.getenv('OLLAMA_HOST'),
         )
+        outcome = 'ok' if summary else 'empty'
     except Exception:
         Summary.update_status(conn, summary_job.id, Status.failed)
         return
+    finally:
+        OLLAMA_GENERATION_SECONDS.labels(model.value, outcome).observe(time.perf_counter() - start)
 
     # save summary and metrics to mongodb
     new_fields = {
         'generated_summary': summary,
     }
-    collection.update_one({'metadata_id': summary_job.id}, {'$set': new_fields})
+    with MONGO_OPERATION_SECONDS.labels('update_one').time():
+        collection.update_one({'metadata_id': summary_job.id}, {'$set': new_fields})
 
     # update status
     Summary.update_status(conn, summary_job.id, Status.completed)
@@ -92,6 +100,8 @@ def update_heartbeat():
 
 
 def main():
+    start_metrics_server(default_port=9100)
+
     # Start heartbeat thread
     heartbeat_thread = threading.Thread(target=update_heartbeat, daemon=True)
     heartbeat_thread.start()
@@ -0,0 +1,11 @@
+import isbnlib
+
+
+def canonical_isbn13(isbn: str) -> str | None:
+    """Digits only ISBN-13 for any valid ISBN-10 or ISBN-13 spelling, None if the input is not an ISBN"""
+    canonical = isbnlib.canonical(isbn)
+    if isbnlib.is_isbn13(canonical):
+        return canonical
+    if isbnlib.is_isbn10(canonical):
+        return isbnlib.to_isbn13(canonical)
+    return None
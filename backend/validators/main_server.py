@@ -25,3 +25,18 @@ def validate_id(task_id: int):
 def validate_page(page: int):
     if page <= 0:
         raise ValidationException('page must be valid')
+
+
+def validate_limit(limit: int, max_limit: int = 100):
+    if limit <= 0 or limit > max_limit:
+        raise ValidationException(f'limit must be between 1 and {max_limit}')
+
+
+def validate_wait(wait: float, max_wait: float):
+    if wait < 0 or wait > max_wait:
+        raise ValidationException(f'wait must be between 0 and {max_wait:g} seconds')
+
+
+def validate_batch_size(size: int, max_size: int):
+    if size <= 0 or size > max_size:
+        raise ValidationException(f'batch must contain between 1 and {max_size} summaries')